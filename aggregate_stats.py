@@ -0,0 +1,281 @@
+"""Wall clock time buckets of counter stats over many stream chunks.
+
+Reads the stats saved by extract_stats_from_video for download_stream chunks,
+places every frame in wall clock time from the chunk start time in its name
+and folds them into an index of per bucket count histograms. The index is
+kept on disk, a run only reads the chunks that were not indexed yet.
+
+Per stream, counter and bucket the aggregates are the mean, percentiles and
+peak of the counts, for instance the queue length of an area counter, and the
+crossings, the sum of the count increments, meaningful for unique counters.
+
+Example run command:
+
+python3.8 aggregate_stats.py -i "/path/to/recordings/*/*_60" --index_dir /path/to/index -o aggregates.csv
+"""
+import argparse
+import csv
+import datetime
+import glob
+import json
+import os
+import pickle
+import time
+
+import download_stream
+import numpy as np
+import stats_io
+
+ap = argparse.ArgumentParser()
+
+ap.add_argument(
+    "-i",
+    "--input",
+    required=True,
+    help="Glob of the output directories of processed chunks")
+
+ap.add_argument(
+    "--index_dir",
+    required=True,
+    type=str,
+    help="Directory of the incremental index")
+
+ap.add_argument(
+    "--bucket_sec",
+    default=60,
+    type=int,
+    help="Length of the time buckets in seconds, fixed when the index is "
+    "created.")
+
+ap.add_argument(
+    "-o",
+    "--output",
+    default=None,
+    type=str,
+    help="Path of the CSV file of per bucket aggregates")
+
+ap.add_argument(
+    "--percentiles",
+    default="50,90,99",
+    type=str,
+    help="Comma separated percentiles of the counts of every bucket.")
+
+ap.add_argument(
+    "--min_age_sec",
+    default=60.0,
+    type=float,
+    help="Only index chunks whose stats were not modified for this many "
+    "seconds, so that chunks being processed are not indexed half done.")
+
+INDEX_FILE_NAME = "aggregate_index.npz"
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_OUTPUT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def load_chunk_stats(output_directory):
+  """Returns {counter name: (times, counts)} saved for one video.
+
+  Times are in seconds from the start of the video and, like the saved
+  series, start with the initial count at time 0.
+  """
+  stats_path = os.path.join(output_directory, stats_io.STATS_FILE_NAME)
+  if os.path.exists(stats_path):
+    names, _, _ = stats_io.read_header(stats_path)
+    rows = stats_io.load_stats(stats_path)
+    return {
+        name: (np.array(rows["time"]), np.array(rows[name], dtype=np.int64))
+        for name in names
+    }
+  stats = {}
+  for pickle_path in sorted(
+      glob.glob(os.path.join(output_directory, "*.pickle"))):
+    with open(pickle_path, "rb") as f_stats:
+      t_to_count = pickle.load(f_stats)
+    name = os.path.splitext(os.path.basename(pickle_path))[0]
+    stats[name] = (np.fromiter(t_to_count.keys(), np.float64,
+                               len(t_to_count)),
+                   np.fromiter(t_to_count.values(), np.int64,
+                               len(t_to_count)))
+  return stats
+
+
+class BucketSeries(object):
+  """Count histograms and crossings of the time buckets of one counter.
+
+  buckets is the sorted (B,) array of bucket numbers, the bucket start time
+  divided by the bucket length. histograms[b, c] is the number of frames of
+  buckets[b] where the count was c.
+  """
+
+  def __init__(self, buckets=None, histograms=None, crossings=None):
+    self.buckets = (np.zeros(0, dtype=np.int64)
+                    if buckets is None else buckets)
+    self.histograms = (np.zeros((0, 1), dtype=np.int64)
+                       if histograms is None else histograms)
+    self.crossings = (np.zeros(0, dtype=np.int64)
+                      if crossings is None else crossings)
+
+  def add(self, buckets, counts, crossings):
+    """Adds frames given their bucket, count and count increment."""
+    if not len(buckets):
+      return
+    counts = np.clip(counts, 0, None)
+    all_buckets = np.union1d(self.buckets, buckets)
+    width = max(self.histograms.shape[1], int(counts.max()) + 1)
+    rows = np.searchsorted(all_buckets, buckets)
+    histograms = np.bincount(
+        rows * width + counts, minlength=len(all_buckets) * width).reshape(
+            len(all_buckets), width)
+    old_rows = np.searchsorted(all_buckets, self.buckets)
+    histograms[old_rows, :self.histograms.shape[1]] += self.histograms
+    all_crossings = np.bincount(
+        rows, weights=crossings, minlength=len(all_buckets)).astype(np.int64)
+    all_crossings[old_rows] += self.crossings
+    self.buckets = all_buckets
+    self.histograms = histograms
+    self.crossings = all_crossings
+
+  def aggregates(self, percentiles):
+    """Returns a dict of (B,) arrays of per bucket aggregates."""
+    samples = self.histograms.sum(axis=1)
+    values = np.arange(self.histograms.shape[1])
+    cumulative = np.cumsum(self.histograms, axis=1)
+    aggregates = {
+        "samples": samples,
+        "mean": (self.histograms * values).sum(axis=1) / np.maximum(samples, 1),
+        # Last non empty count of the histogram.
+        "peak": self.histograms.shape[1] - 1 -
+                np.argmax(self.histograms[:, ::-1] > 0, axis=1),
+    }
+    for percentile in percentiles:
+      rank = np.ceil(percentile / 100.0 * samples)
+      aggregates["p%g" % percentile] = np.argmax(
+          cumulative >= np.maximum(rank, 1)[:, None], axis=1)
+    aggregates["crossings"] = self.crossings
+    return aggregates
+
+
+class AggregateIndex(object):
+  """Bucketed stats of every stream and counter, stored in one file.
+
+  The file is replaced atomically and lists the indexed chunks together with
+  their buckets, so a chunk is never counted twice.
+  """
+
+  def __init__(self, index_dir, bucket_sec):
+    self.path = os.path.join(index_dir, INDEX_FILE_NAME)
+    self.bucket_sec = bucket_sec
+    self.ingested = set()
+    self.series = {}
+    if not os.path.exists(self.path):
+      if not os.path.exists(index_dir):
+        os.makedirs(index_dir)
+      return
+    with np.load(self.path) as arrays:
+      header = json.loads(str(arrays["header"]))
+      if header["bucket_sec"] != bucket_sec:
+        raise ValueError("%s has %d second buckets, not %d" %
+                         (self.path, header["bucket_sec"], bucket_sec))
+      self.ingested = set(header["ingested"])
+      for i, (stream, counter) in enumerate(header["series"]):
+        self.series[(stream, counter)] = BucketSeries(
+            arrays["buckets_%d" % i], arrays["histograms_%d" % i],
+            arrays["crossings_%d" % i])
+
+  def ingest(self, output_directory):
+    """Adds the stats of a processed chunk, returns False if not a chunk."""
+    chunk = download_stream.parse_chunk_name(output_directory)
+    if chunk is None:
+      print(f"skipping {output_directory}, not named like a chunk")
+      return False
+    stream, start_time, _ = chunk
+    start_sec = (start_time - _EPOCH).total_seconds()
+    for counter, (times, counts) in load_chunk_stats(
+        output_directory).items():
+      if len(counts) < 2:
+        continue
+      # The first value is the initial count, not a frame.
+      buckets = np.floor(
+          (start_sec + times[1:]) / self.bucket_sec).astype(np.int64)
+      crossings = np.clip(np.diff(counts), 0, None)
+      self.series.setdefault((stream, counter), BucketSeries()).add(
+          buckets, counts[1:], crossings)
+    self.ingested.add(os.path.abspath(output_directory))
+    return True
+
+  def save(self):
+    keys = sorted(self.series)
+    header = {
+        "bucket_sec": self.bucket_sec,
+        "ingested": sorted(self.ingested),
+        "series": keys,
+    }
+    arrays = {"header": np.array(json.dumps(header))}
+    for i, key in enumerate(keys):
+      arrays["buckets_%d" % i] = self.series[key].buckets
+      arrays["histograms_%d" % i] = self.series[key].histograms
+      arrays["crossings_%d" % i] = self.series[key].crossings
+    tmp_path = self.path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, self.path)
+
+  def rows(self, percentiles):
+    """Yields one dict of aggregates per stream, counter and bucket."""
+    for (stream, counter), series in sorted(self.series.items()):
+      aggregates = series.aggregates(percentiles)
+      for b, bucket in enumerate(series.buckets.tolist()):
+        bucket_start = _EPOCH + datetime.timedelta(
+            seconds=bucket * self.bucket_sec)
+        row = {
+            "stream": stream,
+            "counter": counter,
+            "bucket_start": bucket_start.strftime(_OUTPUT_TIME_FORMAT),
+        }
+        row.update({name: values[b].item()
+                    for name, values in aggregates.items()})
+        row["crossings_per_minute"] = (
+            row["crossings"] * 60.0 / self.bucket_sec)
+        yield row
+
+
+def _is_settled(output_directory, min_age_sec):
+  """Whether the chunk has stats that were not modified for min_age_sec."""
+  paths = glob.glob(os.path.join(output_directory, "*"))
+  if not paths:
+    return False
+  return time.time() - max(os.path.getmtime(p) for p in paths) >= min_age_sec
+
+
+def write_csv(rows, output_path):
+  rows = list(rows)
+  if not rows:
+    print("No aggregates to write")
+    return
+  with open(output_path, "w", newline="") as f_output:
+    writer = csv.DictWriter(f_output, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+  print(f"Saved {len(rows)} buckets to {output_path}")
+
+
+def main():
+  args = vars(ap.parse_args())
+  percentiles = [float(p) for p in args["percentiles"].split(",") if p]
+  index = AggregateIndex(args["index_dir"], args["bucket_sec"])
+  num_ingested = 0
+  for output_directory in sorted(glob.glob(args["input"])):
+    if (not os.path.isdir(output_directory) or
+        os.path.abspath(output_directory) in index.ingested or
+        not _is_settled(output_directory, args["min_age_sec"])):
+      continue
+    num_ingested += index.ingest(output_directory)
+  if num_ingested:
+    index.save()
+  print(f"Indexed {num_ingested} new chunks, {len(index.ingested)} in total")
+  if args["output"]:
+    write_csv(index.rows(percentiles), args["output"])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,76 @@
+"""Renders and encodes annotated frames on a background thread."""
+import queue
+import threading
+
+import cv2
+
+_END_OF_STREAM = object()
+_FOURCC = "mp4v"
+
+
+class AnnotatedVideoWriter(object):
+  """Writes frames annotated by render to a video at a reduced frame rate.
+
+  Only the frames picked by should_write are submitted, render(frame,
+  annotation) draws on them and cv2.VideoWriter encodes them, both on a
+  background thread. At most depth frames wait for the thread, submit blocks
+  beyond that. Submitted frames must not be modified by the caller anymore.
+  """
+
+  def __init__(self, path, frames_per_second, output_fps, render, depth=8):
+    self.path = path
+    self.frames_per_second = frames_per_second
+    self.output_fps = min(output_fps, frames_per_second)
+    self.render = render
+    self.num_written = 0
+    self.last_output_index = None
+    self.error = None
+    self.items = queue.Queue(maxsize=depth)
+    self.thread = threading.Thread(target=self._write, daemon=True)
+    self.thread.start()
+
+  def should_write(self, frame_index):
+    """Whether frame_index starts a new frame of the output video."""
+    output_index = int(frame_index * self.output_fps / self.frames_per_second)
+    if output_index == self.last_output_index:
+      return False
+    self.last_output_index = output_index
+    return True
+
+  def submit(self, frame, annotation):
+    if self.error is not None:
+      raise self.error
+    self.items.put((frame, annotation))
+
+  def _write(self):
+    video_writer = None
+    try:
+      while True:
+        item = self.items.get()
+        if item is _END_OF_STREAM:
+          return
+        frame, annotation = item
+        self.render(frame, annotation)
+        if video_writer is None:
+          height, width = frame.shape[:2]
+          video_writer = cv2.VideoWriter(self.path,
+                                         cv2.VideoWriter_fourcc(*_FOURCC),
+                                         self.output_fps, (width, height))
+        video_writer.write(frame)
+        self.num_written += 1
+    except Exception as e:  # pylint: disable=broad-except
+      self.error = e
+      # Keep draining so that submit never blocks on a dead thread.
+      while self.items.get() is not _END_OF_STREAM:
+        pass
+    finally:
+      if video_writer is not None:
+        video_writer.release()
+
+  def close(self):
+    """Writes the submitted frames and closes the video."""
+    self.items.put(_END_OF_STREAM)
+    self.thread.join()
+    if self.error is not None:
+      raise self.error
+    print(f"Saved {self.num_written} annotated frames to {self.path}")
@@ -0,0 +1,209 @@
+"""Stage level throughput benchmark over synthetic videos.
+
+Generates videos of bright boxes moving over a dark background, runs
+process_video on them with the deterministic fake detector and writes the
+frames per second and per stage timings of its profile as JSON so that runs
+of different versions can be compared.
+
+Example run command:
+
+python3.8 benchmark.py --object_counts 1,10,30 --frame_skips 1,12 -o bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+
+from common_types import Rectangle
+import cv2
+import extract_stats_from_video
+import intersection_configuration
+import numpy as np
+
+ap = argparse.ArgumentParser()
+
+ap.add_argument(
+    "-o",
+    "--output",
+    default="benchmark_results.json",
+    help="Path of the JSON results file")
+
+ap.add_argument(
+    "-wd",
+    "--work_dir",
+    default=None,
+    type=str,
+    help="Directory of the synthetic videos, a temporary one if not set.")
+
+ap.add_argument(
+    "-oc",
+    "--object_counts",
+    default="1,10,30",
+    type=str,
+    help="Comma separated numbers of moving objects per video.")
+
+ap.add_argument(
+    "-fs",
+    "--frame_skips",
+    default="1,12",
+    type=str,
+    help="Comma separated frame skips to benchmark.")
+
+ap.add_argument(
+    "-n",
+    "--num_frames",
+    default=300,
+    type=int,
+    help="Number of frames of every synthetic video.")
+
+ap.add_argument(
+    "-tt",
+    "--tracker_threads",
+    default=1,
+    type=int,
+    help="Number of threads updating trackers between detections.")
+
+BENCHMARK_DATASET = "BENCHMARK_DATASET_CONFIGURATION"
+
+_FRAME_WIDTH = 1280
+_FRAME_HEIGHT = 720
+_FRAMES_PER_SECOND = 25
+_BACKGROUND_COLOR = (30, 30, 30)
+_OBJECT_COLOR = (230, 230, 230)
+_OBJECT_SIZE = (60, 40)
+_MAX_SPEED = 8
+_CONFIDENCE = 0.3
+
+
+def register_benchmark_dataset():
+  """Adds the dataset of the synthetic videos to the configurations."""
+  intersection_configuration.DS_TO_SPECIFIC_PARAMS[BENCHMARK_DATASET] = {
+      intersection_configuration.IMAGE_BOUNDARIES:
+          Rectangle(0, 0, _FRAME_WIDTH, _FRAME_HEIGHT),
+      intersection_configuration.DETECTION_BOUNDARIES: [
+          (0, 0), (0, _FRAME_HEIGHT), (_FRAME_WIDTH, _FRAME_HEIGHT),
+          (_FRAME_WIDTH, 0)
+      ],
+      intersection_configuration.COUNT_IN_AREA: [
+          ("queue_left", [[0, 0], [0, 720], [640, 720], [640, 0]], 0.7)
+      ],
+      intersection_configuration.COUNT_IN_AREA_UNIQUE: [
+          ("crossing_middle", [[600, 0], [600, 720], [680, 720], [680, 0]],
+           0.1)
+      ],
+  }
+
+
+def generate_synthetic_video(video_path, num_objects, num_frames, seed=0):
+  """Writes a video of boxes bouncing inside the frame."""
+  rng = np.random.RandomState(seed)
+  width, height = _OBJECT_SIZE
+  max_position = np.array([_FRAME_WIDTH - width, _FRAME_HEIGHT - height])
+  positions = rng.uniform(0, 1, (num_objects, 2)) * max_position
+  velocities = rng.uniform(-_MAX_SPEED, _MAX_SPEED, (num_objects, 2))
+  writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"),
+                           _FRAMES_PER_SECOND, (_FRAME_WIDTH, _FRAME_HEIGHT))
+  for _ in range(num_frames):
+    frame = np.full((_FRAME_HEIGHT, _FRAME_WIDTH, 3), _BACKGROUND_COLOR,
+                    np.uint8)
+    for start_x, start_y in positions.astype(int):
+      cv2.rectangle(frame, (start_x, start_y),
+                    (start_x + width, start_y + height), _OBJECT_COLOR, -1)
+    writer.write(frame)
+    positions += velocities
+    bounced = (positions < 0) | (positions > max_position)
+    velocities[bounced] *= -1
+    positions = np.clip(positions, 0, max_position)
+  writer.release()
+
+
+def benchmark_video(video_path, frame_skip, tracker_threads, output_directory):
+  """Runs process_video on video_path with the fake detector.
+
+  Returns the frames per second and per stage timings of its profile. The
+  detect stage includes the forward and decode stages of the model, and
+  postprocess the suppress and focus_filter stages.
+  """
+  register_benchmark_dataset()
+  if not os.path.exists(output_directory):
+    os.makedirs(output_directory)
+  args = vars(
+      extract_stats_from_video.ap.parse_args([
+          "-i", video_path, "-o", output_directory, "-ds", BENCHMARK_DATASET,
+          "-m", "fake", "-fw", str(_FRAME_WIDTH), "-c", str(_CONFIDENCE),
+          "-f", str(frame_skip), "-tt", str(tracker_threads), "--profile",
+          "True"
+      ]))
+  extract_stats_from_video.process_video(video_path, args)
+  profile_path = os.path.join(output_directory,
+                              extract_stats_from_video.PROFILE_FILE_NAME)
+  with open(profile_path) as f_profile:
+    profile = json.load(f_profile)
+  active_trackers = profile["values"].get("active_trackers", {})
+  return {
+      "num_frames": profile["num_frames"],
+      "num_detection_frames": profile["num_detection_frames"],
+      "elapsed_sec": profile["elapsed_sec"],
+      "frames_per_second": profile["frames_per_second"],
+      "max_active_trackers": int(active_trackers.get("max", 0)),
+      "stages": profile["stages"],
+  }
+
+
+def _git_revision():
+  try:
+    return subprocess.check_output(
+        ["git", "rev-parse", "HEAD"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.DEVNULL).decode("utf-8").strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run_benchmarks(work_dir, object_counts, frame_skips, num_frames,
+                   tracker_threads):
+  results = []
+  for num_objects in object_counts:
+    video_path = os.path.join(work_dir, "synthetic_%d.mp4" % num_objects)
+    if not os.path.exists(video_path):
+      generate_synthetic_video(video_path, num_objects, num_frames)
+    for frame_skip in frame_skips:
+      print(f"Benchmarking {num_objects} objects, frame skip {frame_skip}")
+      result = benchmark_video(
+          video_path, frame_skip, tracker_threads,
+          os.path.join(work_dir,
+                       "output_%d_%d" % (num_objects, frame_skip)))
+      result.update({"num_objects": num_objects, "frame_skip": frame_skip})
+      print(f"Frames per second {result['frames_per_second']:.1f}")
+      results.append(result)
+  return results
+
+
+def main():
+  args = vars(ap.parse_args())
+  object_counts = [int(count) for count in args["object_counts"].split(",")]
+  frame_skips = [int(skip) for skip in args["frame_skips"].split(",")]
+  work_dir = args["work_dir"] or tempfile.mkdtemp(prefix="crossing_bench_")
+  if not os.path.exists(work_dir):
+    os.makedirs(work_dir)
+  results = run_benchmarks(work_dir, object_counts, frame_skips,
+                           args["num_frames"], args["tracker_threads"])
+  report = {
+      "created": datetime.datetime.now().isoformat(),
+      "git_revision": _git_revision(),
+      "python": platform.python_version(),
+      "opencv": cv2.__version__,
+      "numpy": np.__version__,
+      "num_frames": args["num_frames"],
+      "results": results,
+  }
+  with open(args["output"], "w") as f_output:
+    json.dump(report, f_output, indent=2)
+  print(f"Saved results to {args['output']}")
+
+
+if __name__ == "__main__":
+  main()
@@ -1,5 +1,5 @@
-from shapely.geometry import Point
-from shapely.geometry import Polygon
+import lazy_modules
+import numpy as np
 
 
 def get_intersection_range(a0, a1, b0, b1):
@@ -30,6 +30,8 @@ def get_intersection_range(a0, a1, b0, b1):
 class Rectangle(object):
   """Rectangle object."""
 
+  __slots__ = ('start_x', 'start_y', 'end_x', 'end_y', 'c_x', 'c_y')
+
   def __init__(self, start_x, start_y, end_x, end_y):
     self.start_x = max(start_x, 0)
     self.start_y = max(start_y, 0)
@@ -77,14 +79,129 @@ class Rectangle(object):
             (self.end_x, self.end_y), (self.end_x, self.start_y)]
 
   def to_shapely_polygon(self):
-    return Polygon(self.to_polygon())
+    return lazy_modules.load("shapely.geometry").Polygon(self.to_polygon())
 
   def centroid_coords(self):
     return self.c_x, self.c_y
 
   def centroid_coords_point(self):
-    return Point(self.c_x, self.c_y)
+    return lazy_modules.load("shapely.geometry").Point(self.c_x, self.c_y)
 
   def __str__(self):
     return '(start_x=%s, end_x=%s, start_y=%s, end_y=%s)' % (
         self.start_x, self.end_x, self.start_y, self.end_y)
+
+
+def box_areas(boxes):
+  """Areas of an (N, 4) array of start_x, start_y, end_x, end_y."""
+  return np.prod(np.abs(boxes[:, 2:4] - boxes[:, 0:2]), axis=1)
+
+
+def pairwise_intersection_areas(boxes1, boxes2):
+  """Returns the (N, M) intersection areas of two arrays of boxes."""
+  start = np.maximum(boxes1[:, None, 0:2], boxes2[None, :, 0:2])
+  end = np.minimum(boxes1[:, None, 2:4], boxes2[None, :, 2:4])
+  return np.prod(np.clip(end - start, 0, None), axis=2)
+
+
+class RectBatch(object):
+  """Many rectangles stored as one (N, 4) array.
+
+  Rows are start_x, start_y, end_x, end_y and are clipped at zero like
+  Rectangle coordinates. Indexing with an integer returns a Rectangle and
+  iterating yields Rectangles, so a batch can be passed where a list of
+  rectangles is expected.
+  """
+
+  __slots__ = ('boxes',)
+
+  def __init__(self, boxes):
+    self.boxes = np.maximum(
+        np.asarray(boxes, dtype=np.int64).reshape(-1, 4), 0)
+
+  @classmethod
+  def empty(cls):
+    return cls(np.zeros((0, 4), dtype=np.int64))
+
+  @classmethod
+  def from_rects(cls, rects):
+    return cls([rect.rectangle_coords() for rect in rects])
+
+  def to_rects(self):
+    return [Rectangle(*box) for box in self.boxes.tolist()]
+
+  def __len__(self):
+    return len(self.boxes)
+
+  def __iter__(self):
+    return iter(self.to_rects())
+
+  def __getitem__(self, index):
+    if isinstance(index, (int, np.integer)):
+      return Rectangle(*self.boxes[index].tolist())
+    return RectBatch(self.boxes[index])
+
+  @property
+  def start_x(self):
+    return self.boxes[:, 0]
+
+  @property
+  def start_y(self):
+    return self.boxes[:, 1]
+
+  @property
+  def end_x(self):
+    return self.boxes[:, 2]
+
+  @property
+  def end_y(self):
+    return self.boxes[:, 3]
+
+  def compute_area(self):
+    return box_areas(self.boxes)
+
+  def centroids(self):
+    """(N, 2) integer centers, rounded like Rectangle.centroid_coords."""
+    return (self.boxes[:, 0:2] + self.boxes[:, 2:4]) // 2
+
+  def intersection(self, other):
+    """Row wise intersection, empty ones are (0, 0, 0, 0).
+
+    Rectangle.intersection only zeroes the axis without overlap of an empty
+    intersection, both have a zero area.
+    """
+    start = np.maximum(self.boxes[:, 0:2], other.boxes[:, 0:2])
+    end = np.minimum(self.boxes[:, 2:4], other.boxes[:, 2:4])
+    boxes = np.concatenate([start, end], axis=1)
+    boxes[(end <= start).any(axis=1)] = 0
+    return RectBatch(boxes)
+
+  def union(self, other):
+    """Row wise bounding rectangle of both batches."""
+    return RectBatch(
+        np.concatenate([
+            np.minimum(self.boxes[:, 0:2], other.boxes[:, 0:2]),
+            np.maximum(self.boxes[:, 2:4], other.boxes[:, 2:4])
+        ], axis=1))
+
+  def clip(self, rect):
+    """Clips every rectangle to the bounds of rect."""
+    start_x, start_y, end_x, end_y = rect.rectangle_coords()
+    return RectBatch(
+        np.clip(self.boxes, [start_x, start_y, start_x, start_y],
+                [end_x, end_y, end_x, end_y]))
+
+  def intersection_areas(self, other):
+    """(N, M) intersection areas with the rectangles of other."""
+    return pairwise_intersection_areas(self.boxes, other.boxes)
+
+  def iou_matrix(self, other):
+    """(N, M) intersection over union with the rectangles of other."""
+    intersection = self.intersection_areas(other)
+    union = (self.compute_area()[:, None] + other.compute_area()[None, :] -
+             intersection)
+    return np.divide(intersection, union,
+                     out=np.zeros(union.shape), where=union > 0)
+
+  def __str__(self):
+    return 'RectBatch(%d rectangles)' % len(self)
@@ -1,70 +1,192 @@
-from shapely.geometry import Polygon
+from common_types import box_areas
+import lazy_modules
+import numpy as np
+import run_length
 import utils
+import zones
 
 
 class AbsCounterTrackerPoly(object):
   """Absolute counter with repetition of tracked object that intersect with a polygon."""
 
-  def __init__(self, name, polygon, min_intersection_ratio=0.7):
+  def __init__(self, name, polygon, min_intersection_ratio=0.7,
+               rasterize=False):
     self.name = name
-    self.polygon = Polygon(polygon)
+    self.polygon_coords = polygon
+    self._polygon = None
+    # Approximate intersection areas from a raster, see zones.ZoneRaster.
+    self.rasterize = rasterize
+    self.zone_areas = None
     self.num_object_seen = 0
-    self.count_series = [0]
+    self.count_series = run_length.RunLengthSeries([0])
     self.min_intersection_ratio = min_intersection_ratio
 
-  def get_frame_series(self):
-    return self.count_series
+  @property
+  def polygon(self):
+    """Shapely polygon of the counter, built on first use."""
+    if self._polygon is None:
+      self._polygon = lazy_modules.load("shapely.geometry").Polygon(
+          self.polygon_coords)
+    return self._polygon
+
+  def get_frame_series(self, start=0):
+    """Returns the counts of the frames from start on, one per frame."""
+    return self.count_series.to_list(start)
+
+  def discard_frame_series(self, end):
+    """Forgets the counts of the frames before end, e.g. once saved."""
+    self.count_series.discard_before(end)
 
   def get_counter(self):
     return self.count_series[-1]
 
-  def update(self, rects):
-    """Update counts with newly detected objects."""
-    num_object_seen = 0
-    for rect in rects:
-      if rect.compute_area() == 0:
-        # Model outliers.
-        continue
-      poly = rect.to_shapely_polygon()
-      intersection_ratio = poly.intersection(
-          self.polygon).area / rect.compute_area()
-      if intersection_ratio >= self.min_intersection_ratio:
-        num_object_seen += 1
-    self.count_series.append(num_object_seen)
+  def intersection_areas(self, boxes):
+    if self.zone_areas is None:
+      self.zone_areas = zones.zone_areas([self.polygon_coords], self.rasterize)
+    return self.zone_areas.intersection_areas(boxes)[0]
+
+  def repeat_last(self):
+    """Counts a frame that was not looked at like the previous one."""
+    self.count_series.append(self.count_series[-1])
+
+  def update(self, rects, intersection_areas=None):
+    """Update counts with newly detected objects.
+
+    Args:
+      rects: rectangles of the objects in the frame, a list or a
+        common_types.RectBatch.
+      intersection_areas: optional intersection area of each rectangle with
+        the counter polygon, see CounterGroup.
+    """
+    boxes = utils.rects_to_array(rects)
+    if intersection_areas is None:
+      intersection_areas = self.intersection_areas(boxes)
+    areas = box_areas(boxes)
+    # Zero area rectangles are model outliers.
+    valid = areas > 0
+    intersection_ratio = intersection_areas[valid] / areas[valid]
+    num_object_seen = np.count_nonzero(
+        intersection_ratio >= self.min_intersection_ratio)
+    self.count_series.append(int(num_object_seen))
 
 
 class AbsCounterTrackerUniq(object):
   """Absolute counter without repetition of tracked object that intersect with a polygon."""
 
-  def __init__(self, name, polygon, min_intersection_ratio):
+  def __init__(self, name, polygon, min_intersection_ratio,
+               rasterize=False):
     self.name = name
-    self.polygon = Polygon(polygon)
+    self.polygon_coords = polygon
+    self._polygon = None
+    # Approximate intersection areas from a raster, see zones.ZoneRaster.
+    self.rasterize = rasterize
+    self.zone_areas = None
     self.num_object_seen = 0
-    self.count_series = [0]
+    self.count_series = run_length.RunLengthSeries([0])
     self.min_intersection_ratio = min_intersection_ratio
     self.counted_ids = set()
 
-  def get_frame_series(self):
-    return self.count_series
+  @property
+  def polygon(self):
+    """Shapely polygon of the counter, built on first use."""
+    if self._polygon is None:
+      self._polygon = lazy_modules.load("shapely.geometry").Polygon(
+          self.polygon_coords)
+    return self._polygon
+
+  def get_frame_series(self, start=0):
+    """Returns the counts of the frames from start on, one per frame."""
+    return self.count_series.to_list(start)
+
+  def discard_frame_series(self, end):
+    """Forgets the counts of the frames before end, e.g. once saved."""
+    self.count_series.discard_before(end)
 
   def get_counter(self):
     return self.count_series[-1]
 
-  def update(self, tracker_by_id):
-    """Update counts with newly detected objects."""
-    for id_, tracker in tracker_by_id.items():
+  def intersection_areas(self, boxes):
+    if self.zone_areas is None:
+      self.zone_areas = zones.zone_areas([self.polygon_coords], self.rasterize)
+    return self.zone_areas.intersection_areas(boxes)[0]
+
+  def update(self, tracker_by_id, intersection_areas=None,
+             centers_inside=None):
+    """Update counts with newly detected objects.
+
+    Args:
+      tracker_by_id: mapping from object id to its tracker.
+      intersection_areas: optional intersection area of each tracked
+        rectangle with the counter polygon, in tracker_by_id order.
+      centers_inside: optional bool of each tracked rectangle centroid being
+        inside the counter polygon, in tracker_by_id order.
+    """
+    rects = [
+        utils.get_rect_from_tracker(tracker)
+        for tracker in tracker_by_id.values()
+    ]
+    # Matchers never reuse ids, an id that is not tracked anymore is retired
+    # and does not need to be remembered.
+    self.counted_ids.intersection_update(tracker_by_id)
+    boxes = utils.rects_to_array(rects)
+    if intersection_areas is None:
+      intersection_areas = self.intersection_areas(boxes)
+    areas = box_areas(boxes)
+    for i, (id_, rect) in enumerate(zip(tracker_by_id, rects)):
       if id_ in self.counted_ids:
         continue
-      rect = utils.get_rect_from_tracker(tracker)
-      if rect.compute_area() == 0:
+      if areas[i] == 0:
         # Model outliers.
         continue
-      center_point = rect.centroid_coords_point()
-      poly = rect.to_shapely_polygon()
-      intersection_ratio = poly.intersection(
-          self.polygon).area / rect.compute_area()
-      if self.polygon.contains(
-          center_point) or intersection_ratio > self.min_intersection_ratio:
+      if centers_inside is None:
+        center_inside = self.polygon.contains(rect.centroid_coords_point())
+      else:
+        center_inside = centers_inside[i]
+      intersection_ratio = intersection_areas[i] / areas[i]
+      if center_inside or intersection_ratio > self.min_intersection_ratio:
         self.num_object_seen += 1
         self.counted_ids.add(id_)
     self.count_series.append(self.num_object_seen)
+
+
+class CounterGroup(object):
+  """Counters whose intersection areas are computed together.
+
+  Areas are exact unless rasterize is set, then they are read from one
+  shared zones.ZoneRaster in a single lookup. When a zones.ZoneIndex is
+  given, the rectangle centroids are also classified against the counters
+  polygons in one lookup and passed to the counters update.
+  """
+
+  def __init__(self, counters, zone_index=None, rasterize=False):
+    self.counters = counters
+    self.zone_index = zone_index
+    self.zone_areas = None
+    if counters:
+      self.zone_areas = zones.zone_areas(
+          [counter.polygon_coords for counter in counters], rasterize)
+
+  def update(self, items, boxes):
+    """Updates every counter.
+
+    Args:
+      items: argument of the counters update, rectangles or trackers by id.
+      boxes: (N, 4) array of the rectangles of items, in items order.
+    """
+    if not self.counters:
+      return
+    all_intersection_areas = self.zone_areas.intersection_areas(boxes)
+    if self.zone_index is None:
+      for counter, intersection_areas in zip(self.counters,
+                                             all_intersection_areas):
+        counter.update(items, intersection_areas)
+      return
+
+    # Same rounding as Rectangle.centroid_coords for non negative boxes.
+    centroids = (boxes[:, 0:2] + boxes[:, 2:4]) // 2
+    all_centers_inside = self.zone_index.contains(centroids)
+    for counter, intersection_areas in zip(self.counters,
+                                           all_intersection_areas):
+      counter.update(items, intersection_areas,
+                     all_centers_inside[self.zone_index.names.index(
+                         counter.name)])
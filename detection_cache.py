@@ -0,0 +1,170 @@
+"""Append only on-disk cache of raw detector predictions.
+
+Each cache is a pair of files named after the cache key: a records file with
+one fixed size row per predicted box and an index file with one row per
+processed frame pointing into the records. Both are only ever appended to and
+are memory-mapped when the cache is opened. Processes sharing a cache, like
+the workers processing the segments of one video, hold an exclusive lock on
+the index file while they repair or append to the files.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+
+import detector
+import numpy as np
+
+# Predictions are cached at a low confidence so that --confidence can be tuned
+# on reruns without invalidating the cache.
+CACHE_MIN_CONFIDENCE = 0.1
+
+_HASH_BLOCK_SIZE = 1 << 20
+
+_RECORD_DTYPE = np.dtype([("start_x", "<i4"), ("start_y", "<i4"),
+                          ("end_x", "<i4"), ("end_y", "<i4"),
+                          ("confidence", "<f4"), ("class_id", "<i2")])
+_INDEX_DTYPE = np.dtype([("frame", "<i4"), ("offset", "<i8"), ("count", "<i4")])
+
+
+def video_content_hash(video_path):
+  """Hashes the content of the video so renamed copies share a cache."""
+  sha = hashlib.sha1()
+  with open(video_path, "rb") as f_video:
+    for block in iter(lambda: f_video.read(_HASH_BLOCK_SIZE), b""):
+      sha.update(block)
+  return sha.hexdigest()
+
+
+def cache_key(video_hash, model_name, input_size, frame_skip, labels,
+              roi=None, frame_width=None, image_rect=None):
+  """Returns the name of the cache of the video and detection settings.
+
+  Args:
+    video_hash: video_content_hash of the video.
+    model_name: name of the detector model.
+    input_size: model input size.
+    frame_skip: number of frames between predictions.
+    labels: predicted labels.
+    roi: optional (start_x, start_y, end_x, end_y) crop the model runs on.
+    frame_width: width the frames are resized to before detection.
+    image_rect: optional (start_x, start_y, end_x, end_y) crop of the resized
+      frames, boxes are in its coordinates.
+  """
+  settings = [
+      model_name, list(input_size), frame_skip, CACHE_MIN_CONFIDENCE,
+      sorted(labels), frame_width,
+      None if image_rect is None else list(image_rect)
+  ]
+  if roi is not None:
+    # Detections on a crop differ from detections on the whole frame.
+    settings.append(list(roi))
+  settings = json.dumps(settings)
+  settings_hash = hashlib.sha1(settings.encode("utf-8")).hexdigest()[:12]
+  return "%s_%s" % (video_hash, settings_hash)
+
+
+def _num_rows(path, dtype):
+  if not os.path.exists(path):
+    return 0
+  return os.path.getsize(path) // dtype.itemsize
+
+
+def _truncate(path, dtype, num_rows):
+  if os.path.exists(path):
+    os.truncate(path, num_rows * dtype.itemsize)
+
+
+def _load(path, dtype, num_rows):
+  if num_rows == 0:
+    return np.zeros(0, dtype=dtype)
+  return np.memmap(path, dtype=dtype, mode="r", shape=(num_rows,))
+
+
+class DetectionCache(object):
+  """Per video cache of predictions keyed by frame index."""
+
+  def __init__(self, cache_dir, key, all_labels):
+    if not os.path.exists(cache_dir):
+      os.makedirs(cache_dir)
+    self.min_confidence = CACHE_MIN_CONFIDENCE
+    self.all_labels = all_labels
+    records_path = os.path.join(cache_dir, key + ".records")
+    index_path = os.path.join(cache_dir, key + ".index")
+    self.f_index = open(index_path, "ab")
+    with self._locked():
+      self._read_index(records_path, index_path)
+      self.f_records = open(records_path, "ab")
+
+  @contextlib.contextmanager
+  def _locked(self):
+    fcntl.flock(self.f_index, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(self.f_index, fcntl.LOCK_UN)
+
+  def _read_index(self, records_path, index_path):
+    index = np.array(
+        _load(index_path, _INDEX_DTYPE, _num_rows(index_path, _INDEX_DTYPE)))
+    # Index rows are written after their records, drop rows whose records
+    # did not fully make it to disk.
+    valid = (index["offset"] + index["count"] <=
+             _num_rows(records_path, _RECORD_DTYPE))
+    if not valid.all():
+      index = index[:np.argmin(valid)]
+    num_records = int(index["offset"][-1] +
+                      index["count"][-1]) if len(index) else 0
+    _truncate(index_path, _INDEX_DTYPE, len(index))
+    _truncate(records_path, _RECORD_DTYPE, num_records)
+    self.records = _load(records_path, _RECORD_DTYPE, num_records)
+    self.index = {
+        int(frame): (int(offset), int(count))
+        for frame, offset, count in index.tolist()
+    }
+
+  def __len__(self):
+    return len(self.index)
+
+  def get(self, frame_index):
+    """Returns the cached predictions of the frame or None if missing."""
+    if frame_index not in self.index:
+      return None
+    offset, count = self.index[frame_index]
+    records = self.records[offset:offset + count]
+    boxes = np.stack([records["start_x"], records["start_y"],
+                      records["end_x"], records["end_y"]],
+                     axis=1).astype(np.int64)
+    return detector.Predictions(boxes, np.array(records["confidence"]),
+                                records["class_id"].astype(np.int64),
+                                self.all_labels)
+
+  def append(self, frame_index, predictions):
+    records = np.zeros(len(predictions), dtype=_RECORD_DTYPE)
+    for i, field in enumerate(["start_x", "start_y", "end_x", "end_y"]):
+      records[field] = predictions.boxes[:, i]
+    records["confidence"] = predictions.confidences
+    records["class_id"] = predictions.class_ids
+    with self._locked():
+      # Other processes may have appended since this one last did.
+      offset = (os.fstat(self.f_records.fileno()).st_size //
+                _RECORD_DTYPE.itemsize)
+      records.tofile(self.f_records)
+      self.f_records.flush()
+      np.array([(frame_index, offset, len(records))],
+               dtype=_INDEX_DTYPE).tofile(self.f_index)
+      self.f_index.flush()
+
+  def close(self):
+    self.f_records.close()
+    self.f_index.close()
+
+
+def open_cache(cache_dir, video_path, model_name, frame_skip, labels,
+               roi=None, frame_width=None, image_rect=None):
+  key = cache_key(
+      video_content_hash(video_path), model_name,
+      detector.model_input_size(model_name), frame_skip, labels, roi,
+      frame_width, image_rect)
+  return DetectionCache(cache_dir, key, detector.model_labels(model_name))
@@ -1,10 +1,102 @@
+import threading
+import time
+
 import cv2
 import numpy as np
+import profiling
 
 
 _COCO_NAME_PATH = './resources/coco.names'
 _YOLO3_WEIGHTS_PATH = '../yolov3.weights'
 _YOLO3_CONFIG_PATH = './resources/yolov3.cfg'
+_YOLO3_INPUT_SIZE = (416, 416)
+
+_MODEL_LABELS_PATH = {"yolo3": _COCO_NAME_PATH, "fake": _COCO_NAME_PATH}
+_MODEL_INPUT_SIZE = {"yolo3": _YOLO3_INPUT_SIZE, "fake": _YOLO3_INPUT_SIZE}
+
+# Number of rows output by YOLOv3 over its three scales for a 416x416 input.
+_YOLO3_NUM_ROWS = (13 * 13 + 26 * 26 + 52 * 52) * 3
+_FAKE_BRIGHTNESS_THRESHOLD = 128
+_FAKE_CONFIDENCE = 0.9
+# Timer of the detections that are not profiled.
+_NULL_TIMER = profiling.NullStageTimer()
+
+
+def model_labels(name):
+	return open(_MODEL_LABELS_PATH[name]).read().strip().split("\n")
+
+
+def model_input_size(name):
+	return _MODEL_INPUT_SIZE[name]
+
+
+class Predictions(object):
+	"""Array backed detector predictions.
+
+	boxes is an (N, 4) int array of start_x, start_y, end_x, end_y rows,
+	confidences and class_ids are the matching (N,) arrays.
+	"""
+
+	def __init__(self, boxes, confidences, class_ids, all_labels):
+		self.boxes = boxes
+		self.confidences = confidences
+		self.class_ids = class_ids
+		self.all_labels = all_labels
+
+	@classmethod
+	def empty(cls, all_labels):
+		return cls(np.zeros((0, 4), dtype=np.int64), np.zeros(0, dtype=np.float32),
+				   np.zeros(0, dtype=np.int64), all_labels)
+
+	def __len__(self):
+		return len(self.boxes)
+
+	def select(self, mask):
+		return Predictions(self.boxes[mask], self.confidences[mask],
+						   self.class_ids[mask], self.all_labels)
+
+	def translate(self, offset_x, offset_y):
+		"""Returns the predictions with boxes moved by the given offset."""
+		return Predictions(self.boxes + [offset_x, offset_y, offset_x, offset_y],
+						   self.confidences, self.class_ids, self.all_labels)
+
+	@property
+	def labels(self):
+		return [self.all_labels[class_id] for class_id in self.class_ids]
+
+	def to_pred_dicts(self):
+		predictions = []
+		for (start_x, start_y, end_x, end_y), confidence, label in zip(
+				self.boxes.tolist(), self.confidences, self.labels):
+			predictions.append({'start_x': start_x,
+							  'start_y': start_y,
+							  'end_x': end_x,
+							  'end_y': end_y,
+							  'center_x': (start_x + end_x) // 2,
+							  'center_y': (start_y + end_y) // 2,
+							  'confidence': confidence,
+							  'label': label})
+		return predictions
+
+
+def decode_yolo_output(output, width, height, all_labels, min_confidence=None,
+					   labels=None):
+	"""Decodes raw YOLO rows (center_x, center_y, w, h, objectness, scores...)."""
+	scores = output[:, 5:]
+	class_ids = np.argmax(scores, axis=1)
+	confidences = scores[np.arange(len(scores)), class_ids]
+	mask = np.ones(len(scores), dtype=bool)
+	if min_confidence is not None:
+		mask &= confidences > min_confidence
+	if labels is not None:
+		label_ids = [i for i, label in enumerate(all_labels) if label in labels]
+		mask &= np.isin(class_ids, label_ids)
+	box = output[mask, 0:4] * np.array([width, height, width, height])
+	box = box.astype("int")
+	center, size = box[:, 0:2], box[:, 2:4]
+	start = np.trunc(center - size / 2).astype("int")
+	boxes = np.concatenate([start, start + size], axis=1)
+	return Predictions(boxes, confidences[mask], class_ids[mask], all_labels)
 
 
 class Detector(object):
@@ -12,15 +104,28 @@ class Detector(object):
 	def __init__(self):
 		super(Detector, self).__init__()
 
-	def detect(self, frame):
+	def detect(self, frame, min_confidence=None, labels=None):
 		return
-		
+
+	def detect_batch(self, frames, min_confidence=None, labels=None, timer=None):
+		"""Detects objects in frames.
+
+		Args:
+			frames: frames of the same size.
+			min_confidence: optional minimum confidence of the predictions.
+			labels: optional labels of the predictions.
+			timer: optional profiling.StageTimer, detectors that decode raw model
+				outputs time the forward and decode stages apart.
+		"""
+		return [self.detect(frame, min_confidence, labels) for frame in frames]
+
 class Yolo3Detector(Detector):
 
 	def __init__(self):
 		super(Yolo3Detector, self).__init__()
 		self.labels_path = _COCO_NAME_PATH
-		self.all_labels = open(self.labels_path).read().strip().split("\n")
+		self.all_labels = model_labels("yolo3")
+		self.input_size = _YOLO3_INPUT_SIZE
 		self.weights_path = _YOLO3_WEIGHTS_PATH
 		self.model = cv2.dnn.readNetFromDarknet(_YOLO3_CONFIG_PATH, self.weights_path)
 		self.model.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
@@ -28,38 +133,121 @@ class Yolo3Detector(Detector):
 		self.ln = self.model.getLayerNames()
 		self.ln = [self.ln[i[0] - 1] for i in self.model.getUnconnectedOutLayers()]
 
-	def detect(self, frame):
-		(H, W) = frame.shape[:2]
-		blob = cv2.dnn.blobFromImage(frame, 1 / 255.0, (416, 416), swapRB=True, crop=False)
-		self.model.setInput(blob)
-		layer_output = self.model.forward(self.ln)
+	def detect(self, frame, min_confidence=None, labels=None):
+		return self.detect_batch([frame], min_confidence, labels)[0]
+
+	def detect_batch(self, frames, min_confidence=None, labels=None, timer=None):
+		if timer is None:
+			timer = _NULL_TIMER
+		with timer.stage("forward"):
+			blob = cv2.dnn.blobFromImages(frames, 1 / 255.0, self.input_size, swapRB=True, crop=False)
+			self.model.setInput(blob)
+			layer_output = self.model.forward(self.ln)
+		# Region layers drop the batch axis when there is a single image.
+		layer_output = [output.reshape(len(frames), -1, output.shape[-1])
+						for output in layer_output]
 		predictions = []
-		# loop over the detections
-		for output in layer_output:
-			# loop over each of the detections
-			for detection in output:
-				scores = detection[5:]
-				class_id = np.argmax(scores)
-				confidence = scores[class_id]
-				label = self.all_labels[class_id]
-
-				box = detection[0:4] * np.array([W, H, W, H])
-				(center_x, center_y, width, height) = box.astype("int")
-				start_x = int(center_x - (width / 2))
-				start_y = int(center_y - (height / 2))
-				end_x = start_x + width
-				end_y = start_y + height
-				predictions.append({'start_x': start_x, 
-							  'start_y': start_y, 
-							  'end_x': end_x, 
-							  'end_y': end_y, 
-							  'center_x': center_x,
-							  'center_y': center_y,
-							  'confidence': confidence, 
-							  'label': label})
+		with timer.stage("decode"):
+			for i, frame in enumerate(frames):
+				(H, W) = frame.shape[:2]
+				# All output layers share the same row layout, decode them at once.
+				output = np.concatenate([output[i] for output in layer_output], axis=0)
+				predictions.append(decode_yolo_output(output, W, H, self.all_labels,
+													  min_confidence, labels))
 		return predictions
 
 
+class FakeDetector(Detector):
+	"""Deterministic detector of bright boxes over a dark background.
+
+	It needs no weights and is meant for benchmarks over synthetic videos. Its
+	forward pass outputs rows laid out like YOLOv3 so that post-processing
+	costs the same as with the real model.
+	"""
+
+	def __init__(self, label="car"):
+		super(FakeDetector, self).__init__()
+		self.all_labels = model_labels("fake")
+		self.class_id = self.all_labels.index(label)
+		# Low score rows standing for the background anchors.
+		rng = np.random.RandomState(0)
+		self.background = rng.uniform(
+			0, 0.05, (_YOLO3_NUM_ROWS, 5 + len(self.all_labels))).astype(np.float32)
+
+	def forward(self, frame):
+		"""Returns YOLO like rows with one confident row per bright blob."""
+		(H, W) = frame.shape[:2]
+		gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+		_, mask = cv2.threshold(gray, _FAKE_BRIGHTNESS_THRESHOLD, 255, cv2.THRESH_BINARY)
+		num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+		output = self.background.copy()
+		# Component 0 is the background.
+		for i, (x, y, w, h, _) in enumerate(stats[1:num_labels]):
+			row = output[i]
+			row[0:4] = ((x + w / 2.0) / W, (y + h / 2.0) / H, float(w) / W, float(h) / H)
+			row[4] = _FAKE_CONFIDENCE
+			row[5 + self.class_id] = _FAKE_CONFIDENCE
+		return output
+
+	def detect(self, frame, min_confidence=None, labels=None):
+		return self.detect_batch([frame], min_confidence, labels)[0]
+
+	def detect_batch(self, frames, min_confidence=None, labels=None, timer=None):
+		if timer is None:
+			timer = _NULL_TIMER
+		with timer.stage("forward"):
+			outputs = [self.forward(frame) for frame in frames]
+		with timer.stage("decode"):
+			return [decode_yolo_output(output, frame.shape[1], frame.shape[0],
+									   self.all_labels, min_confidence, labels)
+					for frame, output in zip(frames, outputs)]
+
+
+class LazyDetector(Detector):
+	"""Defers building the named detector until the first detection."""
+
+	def __init__(self, name):
+		super(LazyDetector, self).__init__()
+		self.name = name
+		self.detector = None
+
+	def _get_detector(self):
+		if self.detector is None:
+			self.detector = get_detector(self.name)
+		return self.detector
+
+	def detect(self, frame, min_confidence=None, labels=None):
+		return self._get_detector().detect(frame, min_confidence, labels)
+
+	def detect_batch(self, frames, min_confidence=None, labels=None, timer=None):
+		return self._get_detector().detect_batch(frames, min_confidence, labels,
+												 timer)
+
+
 def detector_factory(name):
 	if name == "yolo3":
-		return Yolo3Detector()
\ No newline at end of file
+		return Yolo3Detector()
+	if name == "fake":
+		return FakeDetector()
+
+
+# Detectors built by get_detector, shared by all the videos of a process.
+_detectors = {}
+_detectors_lock = threading.Lock()
+_load_seconds = {}
+
+
+def get_detector(name):
+	"""Returns the detector of the process for the model, built on first use."""
+	with _detectors_lock:
+		if name not in _detectors:
+			start_time = time.perf_counter()
+			_detectors[name] = detector_factory(name)
+			_load_seconds[name] = time.perf_counter() - start_time
+			print("Loaded %s model in %.2f seconds" % (name, _load_seconds[name]))
+		return _detectors[name]
+
+
+def load_seconds():
+	"""Returns the load time in seconds of every model loaded by the process."""
+	return dict(_load_seconds)
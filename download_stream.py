@@ -2,10 +2,13 @@
 """
 import argparse
 import concurrent.futures
-import collections
 import datetime
+import functools
+import json
 import math
 import os
+import re
+import threading
 
 ap = argparse.ArgumentParser()
 
@@ -14,13 +17,28 @@ _SECONDS_IN_HOUR = 3600
 ap.add_argument("--save_dir", type=str, default='./',
   help="Directory to save the recording")
 ap.add_argument("--max_concurrent_requests", type=int, default=5,
-  help="Directory to save the recording")
+  help="Maximum number of downloads running at once over all streams")
 ap.add_argument("--save_duration_sec", type=int, default=60,
   help="save into video chucnks of this length in seconds")
 ap.add_argument("--total_save_time", type=int, default=_SECONDS_IN_HOUR,
   help="save into videos of this length in seconds")
 ap.add_argument("--name", type=str, help="Name of stream.")
 ap.add_argument("--stream", type=str, help="Stream link.")
+ap.add_argument("--config", type=str, default=None,
+  help="JSON file with a list of {name, stream, max_concurrent} streams, "
+       "used instead of --name and --stream.")
+ap.add_argument("--max_concurrent_per_stream", type=int, default=1,
+  help="Default maximum number of downloads running at once per stream")
+
+# Completed chunks of a stream are listed in this file of its directory.
+MANIFEST_FILE_NAME = "completed_chunks.txt"
+
+# Chunks are named <name>_<start time>_<duration in seconds>.mp4.
+CHUNK_TIME_FORMAT = '%Y:%m:%d:%H:%M:%S'
+_CHUNK_NAME_PATTERN = re.compile(
+    r'^(?P<name>.+)_(?P<time>\d{4}(?::\d{2}){5})_(?P<duration>\d+)$')
+
+_manifest_lock = threading.Lock()
 
 
 
@@ -44,56 +62,210 @@ def download_chuck_list(name, chuck_list, f_path, duration, stream):
 
 
 
-def lunch(executor, name, save_duration_sec, local_dir, stream):
-  current_time_stamp = datetime.datetime.now().strftime('%Y:%m:%d:%H:%M:%S')
+def _append_to_manifest(stream_dir, local_path, future):
+  """Lists the chunk in the stream manifest once fully downloaded."""
+  if future.exception() is not None or future.result() != 0:
+    return
+  with _manifest_lock:
+    with open(os.path.join(stream_dir, MANIFEST_FILE_NAME), "a") as f_manifest:
+      f_manifest.write(os.path.abspath(local_path) + "\n")
+
+
+class _StreamSchedule(object):
+  """Download state of a single stream."""
+
+  def __init__(self, name, stream, max_concurrent, steps):
+    self.name = name
+    self.stream = stream
+    self.max_concurrent = max_concurrent
+    self.steps = steps
+    self.launched = 0
+    self.in_flight = 0
+    # Chunks that are due but wait for a free slot of the stream.
+    self.due = 0
+    self.chuck_list = None
+    self.chuck_list_lock = threading.Lock()
+
+
+class StreamScheduler(object):
+  """Records many streams in consecutive chunks without polling.
+
+  A chunk of a stream is due once the previous chunk recorded
+  save_duration_sec seconds or finished, whichever happens first, and it is
+  started as soon as the stream has less than max_concurrent chunks running.
+  Everything is driven by download completion callbacks and timers. The
+  chunklist of a stream is fetched once and only refreshed after a failed
+  download.
+  """
+
+  def __init__(self, local_dir, total_save_time, save_duration_sec,
+               max_concurrent_requests):
+    self.local_dir = local_dir
+    self.save_duration_sec = save_duration_sec
+    self.steps = int(math.ceil(total_save_time / float(save_duration_sec)))
+    self.max_concurrent_requests = max_concurrent_requests
+    self.schedules = []
+    # Reentrant as callbacks of already finished downloads run on submit.
+    self.lock = threading.RLock()
+    self.done = threading.Event()
+    # First error raised by a timer or completion callback, raised by run().
+    self.error = None
+    self.executor = None
+
+  def add_stream(self, name, stream, max_concurrent=1):
+    self.schedules.append(
+        _StreamSchedule(name, stream, max_concurrent, self.steps))
+
+  def run(self):
+    """Records all streams, returns once every chunk is downloaded."""
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.max_concurrent_requests) as executor:
+      self.executor = executor
+      with self.lock:
+        for schedule in self.schedules:
+          schedule.due += 1
+          self._start_due_chunks(schedule)
+        self._check_done()
+      self.done.wait()
+    if self.error is not None:
+      raise self.error
+
+  def _report_errors(self, callback):
+    """Wraps a timer or completion callback so that its errors stop run()."""
+    @functools.wraps(callback)
+    def report_errors(*args):
+      try:
+        return callback(*args)
+      except Exception as e:  # pylint: disable=broad-except
+        with self.lock:
+          if self.error is None:
+            self.error = e
+        self.done.set()
+    return report_errors
 
-  chuck_list = get_chuck_list(name, local_dir, stream)
-  f_name = '%s_%s_%s.mp4' % (name, current_time_stamp,
-                             save_duration_sec)
-  stream_dir = os.path.join(local_dir, name)
-  if not os.path.exists(stream_dir):
-    os.makedirs(stream_dir)
-  local_path = os.path.join(stream_dir, f_name)
-  future_download = executor.submit(download_chuck_list, name,
-                                    chuck_list, local_path,
-                                    save_duration_sec, stream)
-  return future_download, local_path, f_name
+  def _get_chuck_list(self, schedule):
+    with schedule.chuck_list_lock:
+      if schedule.chuck_list is None:
+        schedule.chuck_list = get_chuck_list(schedule.name, self.local_dir,
+                                             schedule.stream)
+      return schedule.chuck_list
+
+  def _download(self, schedule, local_path):
+    chuck_list = self._get_chuck_list(schedule)
+    status = download_chuck_list(schedule.name, chuck_list, local_path,
+                                 self.save_duration_sec, schedule.stream)
+    if status != 0:
+      with schedule.chuck_list_lock:
+        schedule.chuck_list = None
+    return status
+
+  def _start_due_chunks(self, schedule):
+    """Starts due chunks within the stream limit, called with the lock."""
+    while (self.error is None and schedule.due > 0 and
+           schedule.in_flight < schedule.max_concurrent and
+           schedule.launched < schedule.steps):
+      schedule.due -= 1
+      schedule.launched += 1
+      schedule.in_flight += 1
+      current_time_stamp = datetime.datetime.now().strftime(
+          CHUNK_TIME_FORMAT)
+      f_name = '%s_%s_%s.mp4' % (schedule.name, current_time_stamp,
+                                 self.save_duration_sec)
+      stream_dir = os.path.join(self.local_dir, schedule.name)
+      if not os.path.exists(stream_dir):
+        os.makedirs(stream_dir)
+      local_path = os.path.join(stream_dir, f_name)
+      # The next chunk is requested once, by the timer or the completion.
+      request_next = functools.partial(
+          self._report_errors(self._request_next), schedule,
+          threading.Event())
+      timer = threading.Timer(self.save_duration_sec, request_next)
+      timer.daemon = True
+      timer.start()
+      future_download = self.executor.submit(self._download, schedule,
+                                             local_path)
+      future_download.add_done_callback(
+          self._report_errors(
+              functools.partial(_append_to_manifest, stream_dir, local_path)))
+      future_download.add_done_callback(
+          self._report_errors(
+              functools.partial(self._on_done, schedule, request_next)))
+
+  def _request_next(self, schedule, requested):
+    with self.lock:
+      if requested.is_set():
+        return
+      requested.set()
+      schedule.due += 1
+      self._start_due_chunks(schedule)
+
+  def _on_done(self, schedule, request_next, future):
+    del future  # Failures are reported by the download command.
+    with self.lock:
+      schedule.in_flight -= 1
+    request_next()
+    with self.lock:
+      self._start_due_chunks(schedule)
+      self._check_done()
+
+  def _check_done(self):
+    if all(schedule.launched == schedule.steps and schedule.in_flight == 0
+           for schedule in self.schedules):
+      self.done.set()
+
+
+def parse_chunk_name(path):
+  """Returns (name, start datetime, duration in seconds) of a chunk path.
+
+  The extension is optional, so the output directory of a processed chunk
+  parses as well. Returns None if path is not named like a chunk.
+  """
+  base_name = os.path.basename(os.path.normpath(path))
+  match = (_CHUNK_NAME_PATTERN.match(base_name) or
+           _CHUNK_NAME_PATTERN.match(os.path.splitext(base_name)[0]))
+  if match is None:
+    return None
+  return (match.group('name'),
+          datetime.datetime.strptime(match.group('time'), CHUNK_TIME_FORMAT),
+          int(match.group('duration')))
+
+
+def load_streams_config(config_path):
+  """Loads a JSON list of {"name", "stream", "max_concurrent"} objects."""
+  with open(config_path) as f_config:
+    return json.load(f_config)
 
 
 def save_stream_to_disk(local_dir, total_save_time,
                         save_duration_sec, max_concurrent_requests,
                         name, stream):
-  with concurrent.futures.ThreadPoolExecutor(
-      max_workers=max_concurrent_requests) as executor:
-    steps = int(math.ceil(total_save_time / float(save_duration_sec)))
-    stream_to_results = {}
-    stream_to_steps = collections.defaultdict(int)
-    stream_to_results[name] = lunch(executor, name,
-                                           save_duration_sec, local_dir,
-                                           stream)
-    stream_to_steps[name] += 1
-
-    should_stop = False
-    while not should_stop:
-      for name, result in stream_to_results.items():
-        if result[0].done() and stream_to_steps[name] < steps:
-          stream_to_results[name] = lunch(executor, name,
-                                                 save_duration_sec, local_dir,
-                                                 stream)
-          stream_to_steps[name] += 1
-      should_stop = True
-      for name in stream_to_steps:
-        if stream_to_steps[name] < steps:
-          should_stop = False
-          break
-    executor.shutdown(wait=True)
+  scheduler = StreamScheduler(local_dir, total_save_time, save_duration_sec,
+                              max_concurrent_requests)
+  scheduler.add_stream(name, stream)
+  scheduler.run()
+
+
+def save_streams_to_disk(local_dir, total_save_time, save_duration_sec,
+                         max_concurrent_requests, streams,
+                         max_concurrent_per_stream=1):
+  scheduler = StreamScheduler(local_dir, total_save_time, save_duration_sec,
+                              max_concurrent_requests)
+  for stream_config in streams:
+    scheduler.add_stream(
+        stream_config["name"], stream_config["stream"],
+        stream_config.get("max_concurrent", max_concurrent_per_stream))
+  scheduler.run()
 
 
 def main():
   args = vars(ap.parse_args())
-  save_stream_to_disk(args["save_dir"], args["total_save_time"],
-    args["save_duration_sec"], args["max_concurrent_requests"],
-    args["name"], args["stream"])
+  if args["config"]:
+    streams = load_streams_config(args["config"])
+  else:
+    streams = [{"name": args["name"], "stream": args["stream"]}]
+  save_streams_to_disk(args["save_dir"], args["total_save_time"],
+    args["save_duration_sec"], args["max_concurrent_requests"], streams,
+    args["max_concurrent_per_stream"])
 
 
 if __name__ == '__main__':
@@ -1,25 +1,42 @@
 import argparse
+import collections
 from collections import defaultdict as dd
+import concurrent.futures
+import cProfile
 from datetime import datetime
+import functools
 import glob
+import json
+import marshal
+import multiprocessing
 import os
 import pickle
+import pstats
+import tempfile
 import time
 import time
 
+import annotated_video
 from common_types import Rectangle
 import counters
 import cv2
+import detection_cache
 import detector
-import dlib
-import imutils
-from imutils.video import FPS
 import intersection_configuration
+import lazy_modules
+from matcher import IncrementalMatcher
 from matcher import Matcher
+import motion
 import numpy as np
-from shapely.geometry import Point
-from shapely.geometry import Polygon
+import prefetch
+import profiling
+import run_length
+import segments
+import stats_io
+import stream_batching
+import tracking
 import utils
+import zones
 
 ap = argparse.ArgumentParser()
 
@@ -77,6 +94,290 @@ ap.add_argument(
     type=str,
     help="Model name.")
 
+ap.add_argument(
+    "-b",
+    "--batch_size",
+    default=1,
+    type=int,
+    help="Number of detection frames to run through the model together.")
+
+ap.add_argument(
+    "-dc",
+    "--detection_cache",
+    default=None,
+    type=str,
+    help="Directory of the on-disk detection cache, disabled if not set.")
+
+ap.add_argument(
+    "-nms",
+    "--score_ordered_nms",
+    default=False,
+    type=bool,
+    help="Merge overlapping predictions by decreasing confidence.")
+
+ap.add_argument(
+    "-pf",
+    "--prefetch",
+    default=0,
+    type=int,
+    help="Number of frames decoded ahead on a background thread, 0 to decode "
+    "on the main thread.")
+
+ap.add_argument(
+    "-w",
+    "--workers",
+    default=None,
+    type=int,
+    help="Number of videos, or segments with --segments, processed in "
+    "parallel worker processes. Defaults to the number of segments.")
+
+ap.add_argument(
+    "-tt",
+    "--tracker_threads",
+    default=1,
+    type=int,
+    help="Number of threads updating trackers between detections.")
+
+ap.add_argument(
+    "-mpt",
+    "--min_parallel_trackers",
+    default=4,
+    type=int,
+    help="Minimum number of trackers to update them in parallel.")
+
+ap.add_argument(
+    "-mt",
+    "--matcher",
+    default="default",
+    type=str,
+    help="Matcher name, 'default' re-creates trackers on every detection "
+    "frame, 'incremental' keeps them.")
+
+ap.add_argument(
+    "--reseed_iou",
+    default=0.5,
+    type=float,
+    help="Incremental matcher, re-seed trackers whose IoU with their "
+    "detection is below it.")
+
+ap.add_argument(
+    "--min_match_iou",
+    default=0.0,
+    type=float,
+    help="Incremental matcher, minimum IoU of a tracker and a detection to "
+    "match them.")
+
+ap.add_argument(
+    "--max_match_distance",
+    default=None,
+    type=float,
+    help="Incremental matcher, maximum distance in pixels between matched "
+    "centers.")
+
+ap.add_argument(
+    "--max_missed_detections",
+    default=1,
+    type=int,
+    help="Incremental matcher, number of detection frames an unmatched track "
+    "is kept alive.")
+
+ap.add_argument(
+    "-sf",
+    "--stats_format",
+    default="pickle",
+    type=str,
+    help="'pickle' for one pickle per counter, 'columnar' for a single "
+    "columnar stats file per video.")
+
+ap.add_argument(
+    "--stats_flush_frames",
+    default=0,
+    type=int,
+    help="Columnar stats, number of frames between flushes to disk, 0 to "
+    "write at the end of the video only.")
+
+ap.add_argument(
+    "--profile",
+    default=False,
+    type=bool,
+    help="Write per stage timings of every video to profile.json next to "
+    "its stats.")
+
+ap.add_argument(
+    "--cprofile",
+    default=False,
+    type=bool,
+    help="Run every video under cProfile and write process_video.prof next "
+    "to its stats.")
+
+ap.add_argument(
+    "--follow",
+    default=False,
+    type=bool,
+    help="Treat --input as a glob of download_stream manifests and process "
+    "chunks as soon as they are completed, keeping tracks across chunks.")
+
+ap.add_argument(
+    "--poll_interval",
+    default=5.0,
+    type=float,
+    help="Follow mode, seconds between checks for completed chunks.")
+
+ap.add_argument(
+    "--idle_timeout",
+    default=0.0,
+    type=float,
+    help="Follow mode, stop after this many seconds without a new chunk, 0 "
+    "to never stop.")
+
+ap.add_argument(
+    "-afs",
+    "--adaptive_frame_skip",
+    default=False,
+    type=bool,
+    help="Adapt the frames between predictions to the scene activity, "
+    "starting from --frame_skip. Detection frames are not batched.")
+
+ap.add_argument(
+    "--min_frame_skip",
+    default=3,
+    type=int,
+    help="Adaptive frame skip, minimum number of frames between predictions.")
+
+ap.add_argument(
+    "--max_frame_skip",
+    default=48,
+    type=int,
+    help="Adaptive frame skip, maximum number of frames between predictions.")
+
+ap.add_argument(
+    "--motion_threshold",
+    default=0.001,
+    type=float,
+    help="Adaptive frame skip, fraction of moving focus pixels above which an "
+    "idle scene is detected right away.")
+
+ap.add_argument(
+    "--busy_trackers",
+    default=10,
+    type=int,
+    help="Adaptive frame skip, number of tracked objects from which the "
+    "interval is shortened.")
+
+ap.add_argument(
+    "--max_tracker_drift",
+    default=20.0,
+    type=float,
+    help="Adaptive frame skip, displacement in pixels of a tracked center by "
+    "a detection above which the interval is shortened.")
+
+ap.add_argument(
+    "-roi",
+    "--roi_detection",
+    default=False,
+    type=bool,
+    help="Run the model on the bounding box of the dataset focus polygon "
+    "only.")
+
+ap.add_argument(
+    "--roi_margin",
+    default=64,
+    type=int,
+    help="ROI detection, pixels added around the focus polygon bounding box, "
+    "at least half the size of the largest object.")
+
+ap.add_argument(
+    "-mg",
+    "--motion_gating",
+    default=False,
+    type=bool,
+    help="Skip predictions, and keep tracking, when nothing moved in the focus "
+    "polygon since the last prediction.")
+
+ap.add_argument(
+    "--gate_motion_threshold",
+    default=0.001,
+    type=float,
+    help="Motion gating, fraction of moving focus pixels needed to predict.")
+
+ap.add_argument(
+    "-co",
+    "--count_only",
+    default=False,
+    type=bool,
+    help="Only compute the area counters on the frames picked by frame_skip, "
+    "other frames are skipped without being decoded. Unique counters and "
+    "adaptive frame skip need tracking and are disabled.")
+
+ap.add_argument(
+    "--count_series",
+    default="filled",
+    type=str,
+    help="Count only mode, 'filled' repeats counts over skipped frames so "
+    "series have one value per frame, 'sampled' keeps one value per sampled "
+    "frame, stamped with the time of that frame.")
+
+ap.add_argument(
+    "-seg",
+    "--segments",
+    default=1,
+    type=int,
+    help="Split every video into this many time segments processed in "
+    "parallel by --workers processes and stitched together. Tracks are "
+    "matched across segment boundaries so that unique counters count every "
+    "object once.")
+
+ap.add_argument(
+    "--segment_overlap_sec",
+    default=5.0,
+    type=float,
+    help="Segments, seconds processed before every segment to pick up the "
+    "objects already in the scene.")
+
+ap.add_argument(
+    "-av",
+    "--annotated_video",
+    default=False,
+    type=bool,
+    help="Write the frames with their detections, tracks and counts to "
+    "annotated.mp4 next to the stats, rendered and encoded on a background "
+    "thread. Without it and --display no frame is drawn on.")
+
+ap.add_argument(
+    "--annotated_fps",
+    default=5.0,
+    type=float,
+    help="Annotated video, frames per second kept from the input video.")
+
+ap.add_argument(
+    "-ms",
+    "--multi_stream",
+    default=False,
+    type=bool,
+    help="Treat --input as a JSON list of streams, objects with an 'input' "
+    "video source, a 'dataset' and optionally an 'output' directory. All "
+    "streams are processed in this process on their own threads, their "
+    "detection frames go through one shared model in batches of up to "
+    "--batch_size frames.")
+
+ap.add_argument(
+    "--max_batch_wait_ms",
+    default=20.0,
+    type=float,
+    help="Multi stream, milliseconds a detection frame waits for frames of "
+    "other streams to fill its batch.")
+
+ap.add_argument(
+    "-rz",
+    "--raster_zones",
+    default=False,
+    type=bool,
+    help="Read the intersection areas of objects and counter polygons from "
+    "rasterized zones in constant time instead of computing them exactly. "
+    "Areas are then off by up to a few tens of square pixels along the "
+    "polygon edges, which can change the counts of objects near the count "
+    "ratio.")
+
 INTERESTING_LABELS = set(["car", "bus", "truck"])
 
 BOX_COLOR = (0, 255, 0)
@@ -88,24 +389,97 @@ TEXT_COLOR = (0, 0, 255)
 
 MIN_DISTANCE_TO_FOCUS_RECT = 5
 
+# Native thread pools sized by environment when a worker process starts.
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "MKL_NUM_THREADS")
+
+PROFILE_FILE_NAME = "profile.json"
+_CPROFILE_FILE_NAME = "process_video.prof"
+# Frames between predictions in effect at every frame, adaptive frame skip.
+_DETECTION_INTERVAL_FILE_NAME = "detection_interval.npy"
+_ANNOTATED_VIDEO_FILE_NAME = "annotated.mp4"
+
+# Per worker process state, set by _init_worker.
+_worker_args = None
+_worker_detector_model = None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_zone_index(dataset_name):
+  """Returns the ZoneIndex of the dataset, built once per process."""
+  params = intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(
+      dataset_name, None)
+  if not params:
+    return None
+  return zones.ZoneIndex.from_dataset_params(params)
+
+
+def _get_image_rect(dataset_name):
+  """Returns the Rectangle the resized frames are cropped to, or None."""
+  params = intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(
+      dataset_name, None)
+  if not params:
+    return None
+  return params[intersection_configuration.IMAGE_BOUNDARIES]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_detection_roi(dataset_name, margin):
+  """Returns the bounding Rectangle of the dataset focus polygon.
+
+  The rectangle is grown by margin pixels on every side so that objects
+  centered inside the polygon are not cut by the crop.
+  """
+  params = intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(
+      dataset_name, None)
+  if not params:
+    return None
+  focus_polygon = np.array(
+      params[intersection_configuration.DETECTION_BOUNDARIES]).reshape(-1, 2)
+  start_x, start_y = focus_polygon.min(axis=0) - margin
+  end_x, end_y = focus_polygon.max(axis=0) + margin
+  # Negative starts are clipped by Rectangle, ends by crop_image.
+  return Rectangle(int(start_x), int(start_y), int(end_x), int(end_y))
+
+
+def _filter_predictions(predictions, dataset_name, score_ordered_nms=False,
+                        timer=None):
+  """Converts predictions to a RectBatch inside the dataset focus zone."""
+  if timer is None:
+    timer = profiling.NullStageTimer()
+  rects = utils.predictions_to_rect_batch(predictions)
+  with timer.stage("suppress"):
+    # Merge adjcent objects as model may output multiple rectangles per
+    # object.
+    keep = utils.suppress_overlapping_boxes(
+        rects.boxes,
+        scores=predictions.confidences if score_ordered_nms else None)
+    rects = rects[keep]
+  zone_index = _get_zone_index(dataset_name)
+  if zone_index is not None:
+    with timer.stage("focus_filter"):
+      rects = rects[zone_index.focus_contains(rects.centroids())]
+  return rects
+
 
 def extract_rectangles_from_predictions(frame, dataset_name, detector_model,
-                                        min_confidence):
+                                        min_confidence,
+                                        score_ordered_nms=False):
   """Extracts rectangles from model predictions."""
   predictions = utils.compute_predictions(detector_model, frame, min_confidence,
                                           INTERESTING_LABELS)
-  predictions_rect = [utils.pred_to_rect(pred) for pred in predictions]
-  # Merge adjcent objects as model may output multiple rectangles per object.
-  predictions_rect = utils.merge_adjcent_predictions(predictions_rect)
-  if intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(dataset_name, None):
-    focus_rect = intersection_configuration.DS_TO_SPECIFIC_PARAMS[dataset_name][
-        intersection_configuration.DETECTION_BOUNDARIES]
-    predictions_rect = [
-        rect for rect in predictions_rect
-        if utils.is_fully_contained_poly(rect, focus_rect)
-    ]
+  return _filter_predictions(predictions, dataset_name, score_ordered_nms)
+
 
-    return predictions_rect
+def extract_rectangles_from_batch(frames, dataset_name, detector_model,
+                                  min_confidence, score_ordered_nms=False):
+  """Extracts rectangles from model predictions over a batch of frames."""
+  batch_predictions = utils.compute_predictions_batch(
+      detector_model, frames, min_confidence, INTERESTING_LABELS)
+  return [
+      _filter_predictions(predictions, dataset_name, score_ordered_nms)
+      for predictions in batch_predictions
+  ]
 
 
 def _check_if_output_exists(input_video_path, args):
@@ -138,137 +512,818 @@ def _create_dataset_counters(dataset_name):
   return abs_counter_rects, touch_line_counters
 
 
-def _draw_detections(frame, tracker_by_id, dataset_name, abs_counter_rects,
-                     touch_line_counters):
+# Overlay of one frame, drawn on the main thread for display or on the
+# annotated video thread.
+_Annotation = collections.namedtuple(
+    "_Annotation",
+    ["prediction_boxes", "tracked_ids", "tracked_boxes", "counts"])
+
+
+@functools.lru_cache(maxsize=None)
+def _get_overlay_polygons(dataset_name):
+  """Returns the (-1, 1, 2) point arrays of the counter and focus polygons."""
+  params = intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(
+      dataset_name, None)
+  if not params:
+    return [], None
+  counter_polygons = [
+      np.array(r).reshape((-1, 1, 2))
+      for _, r, _ in params[intersection_configuration.COUNT_IN_AREA] +
+      params[intersection_configuration.COUNT_IN_AREA_UNIQUE]
+  ]
+  focus_polygon = np.array(
+      params[intersection_configuration.DETECTION_BOUNDARIES]).reshape(
+          (-1, 1, 2))
+  return counter_polygons, focus_polygon
+
+
+def _create_annotation(prediction_boxes, tracker_by_id, tracked_boxes,
+                       abs_counter_rects, touch_line_counters):
+  return _Annotation(prediction_boxes, list(tracker_by_id), tracked_boxes, [
+      (counter.name, counter.get_counter())
+      for counter in abs_counter_rects + touch_line_counters
+  ])
+
+
+def _draw_detections(frame, annotation, dataset_name):
   """Draw detections on existing frame."""
-  for id_, tracker in tracker_by_id.items():
-    rect = utils.get_rect_from_tracker(tracker)
+  for start_x, start_y, end_x, end_y in annotation.prediction_boxes.tolist():
+    cv2.rectangle(frame, (start_x, start_y), (end_x, end_y), OUT_COLOR, 2)
+
+  for id_, (start_x, start_y, _, _) in zip(annotation.tracked_ids,
+                                           annotation.tracked_boxes.tolist()):
     text_id = f"id={id_}"
-    cv2.putText(frame, text_id, (rect.start_x, rect.start_y),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.40, TEXT_COLOR, 2)
+    cv2.putText(frame, text_id, (start_x, start_y), cv2.FONT_HERSHEY_SIMPLEX,
+                0.40, TEXT_COLOR, 2)
 
-  if intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(
-      dataset_name, None):
-    for i, im_counter in enumerate(abs_counter_rects + touch_line_counters):
-      s = " %s=%s " % (im_counter.name, im_counter.get_counter())
-      cv2.putText(frame, s, (0, (i + 1) * 20), cv2.FONT_HERSHEY_SIMPLEX,
-                  0.40, TEXT_COLOR, 2)
+  for i, (name, count) in enumerate(annotation.counts):
+    s = " %s=%s " % (name, count)
+    cv2.putText(frame, s, (0, (i + 1) * 20), cv2.FONT_HERSHEY_SIMPLEX, 0.40,
+                TEXT_COLOR, 2)
 
-    for t in intersection_configuration.DS_TO_SPECIFIC_PARAMS[dataset_name][
-        intersection_configuration
-        .COUNT_IN_AREA] + intersection_configuration.DS_TO_SPECIFIC_PARAMS[
-            dataset_name][intersection_configuration.COUNT_IN_AREA_UNIQUE]:
-      _, r, _ = t
-      pts = np.array(r).reshape((-1, 1, 2))
-      cv2.polylines(frame, [pts], True, TEXT_COLOR)
+  counter_polygons, focus_polygon = _get_overlay_polygons(dataset_name)
+  if counter_polygons:
+    cv2.polylines(frame, counter_polygons, True, TEXT_COLOR)
+  if focus_polygon is not None:
+    cv2.polylines(frame, [focus_polygon], True, FOCUS_COLOR)
+
+
+def _create_annotated_video_writer(output_directory, dataset_name,
+                                   frames_per_second, args):
+  if not args["annotated_video"] or output_directory is None:
+    return None
+  out_f_name = os.path.join(output_directory, _ANNOTATED_VIDEO_FILE_NAME)
+  return annotated_video.AnnotatedVideoWriter(
+      out_f_name, frames_per_second, args["annotated_fps"],
+      functools.partial(_draw_detections, dataset_name=dataset_name))
 
-    poly = intersection_configuration.DS_TO_SPECIFIC_PARAMS[dataset_name][
-        intersection_configuration.DETECTION_BOUNDARIES]
-    pts = np.array(poly).reshape((-1, 1, 2))
-    cv2.polylines(frame, [pts], True, FOCUS_COLOR)
 
+def _create_matcher(args, tracker_updater):
+  if args["matcher"] == "incremental":
+    return IncrementalMatcher(tracker_updater, args["reseed_iou"],
+                              args["min_match_iou"],
+                              args["max_match_distance"],
+                              args["max_missed_detections"])
+  return Matcher()
 
-def _is_inside_focus_zone(focus_rect, tracker):
-  return focus_rect.exterior.distance(
-      Point(utils.get_rect_from_tracker(
-          tracker).centroid_coords())) > MIN_DISTANCE_TO_FOCUS_RECT
+
+def _filter_focus_zone(zone_index, tracker_by_id):
+  """Keeps trackers whose centroid is away from the focus boundary."""
+  centroids = [
+      utils.get_rect_from_tracker(tracker).centroid_coords()
+      for tracker in tracker_by_id.values()
+  ]
+  is_inside = zone_index.focus_boundary_distance(
+      centroids) > MIN_DISTANCE_TO_FOCUS_RECT
+  return {
+      id_: tracker
+      for (id_, tracker), inside in zip(tracker_by_id.items(), is_inside)
+      if inside
+  }
+
+
+def _create_stats_writer(abs_counter_rects, touch_line_counters,
+                         output_directory, frames_per_second, args,
+                         start_time_sec=0.0):
+  if args["stats_format"] != "columnar":
+    return None
+  out_f_name = os.path.join(output_directory, stats_io.STATS_FILE_NAME)
+  return stats_io.StatsWriter(
+      out_f_name,
+      [counter.name for counter in abs_counter_rects + touch_line_counters],
+      frames_per_second, start_time_sec)
 
 
 def _save_stats(abs_counter_rects, touch_line_counters, output_directory,
-                frames_per_second):
+                frames_per_second, stats_writer=None, start_time_sec=0.0):
+  if stats_writer is not None:
+    print(f"Saving to {stats_writer.path}")
+    stats_writer.write_counters(abs_counter_rects + touch_line_counters)
+    stats_writer.close()
+    return
+
   for counter_rec in abs_counter_rects + touch_line_counters:
     events = np.array(counter_rec.get_frame_series())
-    times = np.array(range(len(events))) / float(frames_per_second)
+    times = start_time_sec + np.array(range(len(events))) / float(
+        frames_per_second)
     t_to_count = {t: e for t, e in zip(times, events)}
     out_f_name = os.path.join(output_directory, counter_rec.name + ".pickle")
     print(f"Saving to {out_f_name}")
     pickle.dump(t_to_count, open(out_f_name, "wb"))
 
 
-def process_video(input_video_path, args):
-  """Process video to produce and save aggrgative stats."""
+def _save_profile(input_video_path, output_directory, timer, elapsed_sec,
+                  num_frames, num_detection_frames):
+  profile = {
+      "video": input_video_path,
+      "num_frames": num_frames,
+      "num_detection_frames": num_detection_frames,
+      "elapsed_sec": elapsed_sec,
+      "frames_per_second": num_frames / elapsed_sec if elapsed_sec else 0.0,
+      "stages": timer.summary(),
+      "values": timer.values_summary(),
+      "model_load_sec": detector.load_seconds(),
+  }
+  out_f_name = os.path.join(output_directory, PROFILE_FILE_NAME)
+  print(f"Saving to {out_f_name}")
+  with open(out_f_name, "w") as f_profile:
+    json.dump(profile, f_profile, indent=2)
+
+
+def _cprofile_stats(profiler):
+  """Returns the stats of a cProfile.Profile, as saved by dump_stats."""
+  profiler.create_stats()
+  return profiler.stats
+
+
+def _save_cprofile_stats(output_directory, all_stats):
+  """Saves the cProfile stats of many runs merged into one file."""
+  out_f_name = os.path.join(output_directory, _CPROFILE_FILE_NAME)
+  with tempfile.TemporaryDirectory() as stats_directory:
+    stats_paths = []
+    for i, stats in enumerate(all_stats):
+      stats_path = os.path.join(stats_directory, "%d.prof" % i)
+      with open(stats_path, "wb") as f_stats:
+        marshal.dump(stats, f_stats)
+      stats_paths.append(stats_path)
+    print(f"Saving to {out_f_name}")
+    pstats.Stats(*stats_paths).dump_stats(out_f_name)
+
+
+def _resize_crop(frame, args, image_rect):
+  frame = lazy_modules.load("imutils").resize(frame, width=args["frame_width"])
+  if image_rect is not None:
+    frame = utils.crop_image(frame, image_rect)
+  return frame
+
+
+def _read_frames(vs, args, image_rect, timer):
+  """Yields resized and cropped frames until the end of the stream."""
+  while True:
+    with timer.stage("read"):
+      _, frame = vs.read()
+    if frame is None:
+      return
+
+    with timer.stage("resize_crop"):
+      frame = _resize_crop(frame, args, image_rect)
+    yield frame
+
+
+def _grab_frames(vs, args, image_rect, timer, first_frame_index=0):
+  """Yields frames picked by frame_skip and None for the other frames.
+
+  The other frames are only grabbed, they are never decoded.
+  """
+  frame_index = first_frame_index
+  while True:
+    if frame_index % args["frame_skip"] == 0:
+      with timer.stage("read"):
+        _, frame = vs.read()
+      if frame is None:
+        return
+      with timer.stage("resize_crop"):
+        frame = _resize_crop(frame, args, image_rect)
+      yield frame
+    else:
+      with timer.stage("grab"):
+        if not vs.grab():
+          return
+      yield None
+    frame_index += 1
+
+
+def _roi(args):
+  if not args["roi_detection"]:
+    return None
+  return _get_detection_roi(args["dataset"], args["roi_margin"])
+
+
+def _detect_frames(detector_model, frames, min_confidence, roi, timer=None):
+  """Runs the model on frames, or on their roi with boxes mapped back."""
+  if roi is None:
+    return utils.compute_predictions_batch(detector_model, frames,
+                                           min_confidence, INTERESTING_LABELS,
+                                           timer)
+  batch_predictions = utils.compute_predictions_batch(
+      detector_model, [utils.crop_image(frame, roi) for frame in frames],
+      min_confidence, INTERESTING_LABELS, timer)
+  return [
+      predictions.translate(roi.start_x, roi.start_y)
+      for predictions in batch_predictions
+  ]
+
+
+def _compute_batch_predictions(frames, frame_indices, detector_model, cache,
+                               args, timer=None):
+  """Computes predictions of frames, replaying them from the cache if set."""
+  if cache is None:
+    return _detect_frames(detector_model, frames, args["confidence"],
+                          _roi(args), timer)
+  batch_predictions = [cache.get(i) for i in frame_indices]
+  missing = [k for k, pred in enumerate(batch_predictions) if pred is None]
+  if missing:
+    detected = _detect_frames(detector_model, [frames[k] for k in missing],
+                              cache.min_confidence, _roi(args), timer)
+    for k, predictions in zip(missing, detected):
+      cache.append(frame_indices[k], predictions)
+      batch_predictions[k] = predictions
+  return [
+      predictions.select(predictions.confidences > args["confidence"])
+      for predictions in batch_predictions
+  ]
+
+
+def _detect_buffered(buffered, dataset_name, detector_model, cache, args,
+                     timer):
+  """Runs one batched detection over the buffered frames, yields in order."""
+  detections = [(frame_index, frame)
+                for frame_index, frame, is_detection in buffered
+                if is_detection]
+  batch_rects = iter([])
+  if detections:
+    frame_indices, frames = zip(*detections)
+    with timer.stage("detect"):
+      batch_predictions = _compute_batch_predictions(
+          list(frames), list(frame_indices), detector_model, cache, args,
+          timer)
+    with timer.stage("postprocess"):
+      batch_rects = iter([
+          _filter_predictions(predictions, dataset_name,
+                              args["score_ordered_nms"], timer)
+          for predictions in batch_predictions
+      ])
+  for frame_index, frame, is_detection in buffered:
+    predictions_rect = next(batch_rects) if is_detection else None
+    yield frame_index, frame, predictions_rect
+
+
+def _iter_detections(frames, dataset_name, detector_model, cache, args,
+                     timer, first_frame_index=0):
+  """Yields (frame_index, frame, predictions_rect) in frame order.
+
+  predictions_rect is None for frames that are not picked by frame_skip.
+  Detection frames are buffered so that up to batch_size of them go through
+  the model in a single forward pass.
+  """
+  motion_gate = _create_motion_gate(dataset_name, args)
+  buffered = []
+  num_detection_frames = 0
+  for frame_index, frame in enumerate(frames, first_frame_index):
+    is_detection = frame_index % args["frame_skip"] == 0
+    if is_detection and motion_gate is not None:
+      with timer.stage("motion_gate"):
+        is_detection = motion_gate.should_detect(frame)
+    if is_detection:
+      if num_detection_frames == args["batch_size"]:
+        yield from _detect_buffered(buffered, dataset_name, detector_model,
+                                    cache, args, timer)
+        buffered = []
+        num_detection_frames = 0
+      num_detection_frames += 1
+    buffered.append((frame_index, frame, is_detection))
+  yield from _detect_buffered(buffered, dataset_name, detector_model, cache,
+                              args, timer)
+
+
+def _iter_adaptive_detections(frames, dataset_name, detector_model, cache,
+                              args, timer, frame_skip, first_frame_index=0):
+  """Yields (frame_index, frame, predictions_rect) picked by frame_skip.
+
+  Unlike _iter_detections nothing is buffered, frame_skip decides on a frame
+  only after the previous one was yielded and frame_skip.update was called.
+  """
+  motion_gate = _create_motion_gate(dataset_name, args)
+  for frame_index, frame in enumerate(frames, first_frame_index):
+    with timer.stage("schedule"):
+      is_detection = frame_skip.is_detection(frame)
+    if is_detection and motion_gate is not None:
+      with timer.stage("motion_gate"):
+        is_detection = motion_gate.should_detect(frame)
+    yield from _detect_buffered([(frame_index, frame, is_detection)],
+                                dataset_name, detector_model, cache, args,
+                                timer)
+
+
+def _create_focus_motion(dataset_name):
+  focus_polygon = None
+  if intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(dataset_name, None):
+    focus_polygon = intersection_configuration.DS_TO_SPECIFIC_PARAMS[
+        dataset_name][intersection_configuration.DETECTION_BOUNDARIES]
+  return motion.FocusMotion(focus_polygon)
+
+
+def _create_motion_gate(dataset_name, args):
+  if not args["motion_gating"]:
+    return None
+  return motion.MotionGate(
+      _create_focus_motion(dataset_name), args["gate_motion_threshold"])
+
+
+def _create_frame_skip(dataset_name, args):
+  if not args["adaptive_frame_skip"]:
+    return None
+  return motion.AdaptiveFrameSkip(args["frame_skip"], args["min_frame_skip"],
+                                  args["max_frame_skip"],
+                                  _create_focus_motion(dataset_name),
+                                  args["motion_threshold"],
+                                  args["busy_trackers"],
+                                  args["max_tracker_drift"])
+
+
+def _open_detection_cache(input_video_path, args):
+  if not args["detection_cache"]:
+    return None
+  if args["confidence"] < detection_cache.CACHE_MIN_CONFIDENCE:
+    print("confidence is below the cached confidence, not using the cache")
+    return None
+  roi = _roi(args)
+  image_rect = _get_image_rect(args["dataset"])
+  # Cached boxes are in the coordinates of the resized and cropped frames.
+  return detection_cache.open_cache(
+      args["detection_cache"], input_video_path, args["model"],
+      args["frame_skip"], INTERESTING_LABELS,
+      roi.rectangle_coords() if roi is not None else None,
+      args["frame_width"],
+      image_rect.rectangle_coords() if image_rect is not None else None)
+
+
+class StreamState(object):
+  """Tracking state carried over consecutive videos of the same stream."""
+
+  def __init__(self, args):
+    self.tracker_updater = tracking.TrackerUpdater(
+        args["tracker_threads"], args["min_parallel_trackers"])
+    self.matcher = _create_matcher(args, self.tracker_updater)
+    self.tracker_by_id = {}
+    # Ids already counted by each unique counter that are still tracked.
+    self.counted_ids_by_name = {}
+
+  def close(self):
+    self.tracker_updater.close()
+
+
+def process_video(input_video_path, args, detector_model=None,
+                  stream_state=None, segment=None):
+  """Process video to produce and save aggrgative stats.
+
+  Args:
+    input_video_path: path of the video to process.
+    args: parsed command line arguments.
+    detector_model: optional detector shared across videos, built from
+      args["model"] when not set.
+    stream_state: optional StreamState of the previous video of the same
+      stream, tracks continue from it and it is updated for the next video.
+    segment: optional segments.Segment, only its frames are processed and
+      a segments.SegmentResult is returned instead of saving the stats.
+  """
   dataset_name = args["dataset"]
 
-  output_directory = _check_if_output_exists(input_video_path, args)
-  if output_directory is None:
-    return
+  output_directory = None
+  if segment is None:
+    output_directory = _check_if_output_exists(input_video_path, args)
+    if output_directory is None:
+      return
 
   vs = cv2.VideoCapture(input_video_path)
   frames_per_second = int(vs.get(cv2.CAP_PROP_FPS))
   print(f"Frames per seconds {frames_per_second}")
-  _, frame = vs.read()
+  first_frame_index = 0
+  if segment is None:
+    _, frame = vs.read()
+  else:
+    # The first video frame is skipped, frame i is video frame i + 1.
+    first_frame_index = segment.warmup_start
+    vs.set(cv2.CAP_PROP_POS_FRAMES, first_frame_index + 1)
 
-  detector_model = detector.detector_factory(args["model"])
+  cache = _open_detection_cache(input_video_path, args)
+  if cache is not None:
+    print(f"Cached detection frames {len(cache)}")
+  if detector_model is None:
+    if cache is None:
+      detector_model = detector.get_detector(args["model"])
+    else:
+      # Only build the model if some detection frame is not cached.
+      detector_model = detector.LazyDetector(args["model"])
   abs_counter_rects, touch_line_counters = _create_dataset_counters(
       dataset_name)
+  count_only = args["count_only"]
+  series_frames_per_second = frames_per_second
+  # Time of the initial count that starts every series.
+  series_start_time_sec = 0.0
+  if count_only:
+    if touch_line_counters:
+      print("Unique counters need tracking, skipped in count only mode")
+    touch_line_counters = []
+    if args["count_series"] == "sampled":
+      series_frames_per_second = frames_per_second / float(args["frame_skip"])
+      # Sample k is frame k * frame_skip, at k / series_frames_per_second.
+      series_start_time_sec = -1.0 / series_frames_per_second
+  # Zones are rasterized once so counters cost the same for any polygon.
+  zone_index = _get_zone_index(dataset_name)
+  abs_counter_group = counters.CounterGroup(abs_counter_rects,
+                                            rasterize=args["raster_zones"])
+  touch_line_group = counters.CounterGroup(touch_line_counters, zone_index,
+                                           args["raster_zones"])
 
-  image_rect = None
-  if intersection_configuration.DS_TO_SPECIFIC_PARAMS.get(dataset_name, None):
-    image_rect = intersection_configuration.DS_TO_SPECIFIC_PARAMS[dataset_name][
-        intersection_configuration.IMAGE_BOUNDARIES]
-
-  # Remove objects near the outliers of the focus
-  focus_rect = Polygon(
-      intersection_configuration.DS_TO_SPECIFIC_PARAMS[dataset_name][
-          intersection_configuration.DETECTION_BOUNDARIES])
+  image_rect = _get_image_rect(dataset_name)
 
-  matcher = Matcher()
-  tracker_by_id = {}
+  owns_stream_state = stream_state is None
+  if owns_stream_state:
+    stream_state = StreamState(args)
+  tracker_updater = stream_state.tracker_updater
+  matcher = stream_state.matcher
+  tracker_by_id = stream_state.tracker_by_id
+  # Objects counted at the end of the previous video are not counted again.
+  for touch_line_counter in touch_line_counters:
+    touch_line_counter.counted_ids.update(
+        stream_state.counted_ids_by_name.get(touch_line_counter.name, ()))
+  profiler = None
+  if args["cprofile"]:
+    profiler = cProfile.Profile()
+    profiler.enable()
+  timer = profiling.StageTimer() if args["profile"] else (
+      profiling.NullStageTimer())
+  fps = lazy_modules.load("imutils.video").FPS().start()
+  num_frames = 0
+  num_detection_frames = 0
   # loop over the frames.
-  total_frames = -1
-  while True:
-    total_frames += 1
-    _, frame = vs.read()
-    if frame is None:
+  if count_only:
+    frames = _grab_frames(vs, args, image_rect, timer, first_frame_index)
+  else:
+    frames = _read_frames(vs, args, image_rect, timer)
+  if args["prefetch"] > 0:
+    # OpenCV decoding and resizing release the GIL.
+    frames = prefetch.PrefetchIterator(frames, args["prefetch"])
+  stats_writer = None
+  if output_directory is not None:
+    stats_writer = _create_stats_writer(abs_counter_rects,
+                                        touch_line_counters, output_directory,
+                                        series_frames_per_second, args,
+                                        series_start_time_sec)
+  boundary_recorder = None
+  if segment is not None:
+    boundary_recorder = segments.BoundaryRecorder(segment, touch_line_counters)
+  frame_skip = None
+  annotated_writer = None
+  if not count_only:
+    frame_skip = _create_frame_skip(dataset_name, args)
+    annotated_writer = _create_annotated_video_writer(
+        output_directory, dataset_name, frames_per_second, args)
+  if frame_skip is None:
+    detections = _iter_detections(frames, dataset_name, detector_model, cache,
+                                  args, timer, first_frame_index)
+  else:
+    detections = _iter_adaptive_detections(frames, dataset_name,
+                                           detector_model, cache, args, timer,
+                                           frame_skip, first_frame_index)
+  for frame_index, frame, predictions_rect in detections:
+    if (segment is not None and segment.end is not None and
+        frame_index >= segment.end):
       break
+    if (stats_writer is not None and args["stats_flush_frames"] > 0 and
+        frame_index % args["stats_flush_frames"] == 0):
+      stats_writer.write_counters(abs_counter_rects + touch_line_counters)
 
-    frame = imutils.resize(frame, width=args["frame_width"])
-    if image_rect is not None:
-      frame = utils.crop_image(frame, image_rect)
+    if count_only:
+      with timer.stage("counters"):
+        if predictions_rect is not None:
+          num_detection_frames += 1
+          abs_counter_group.update(predictions_rect,
+                                   utils.rects_to_array(predictions_rect))
+        elif (args["count_series"] == "filled" or
+              frame_index % args["frame_skip"] == 0):
+          # Not sampled, or nothing moved since the last prediction.
+          for counter_rect in abs_counter_rects:
+            counter_rect.repeat_last()
+      fps.update()
+      num_frames += 1
+      continue
 
-    if total_frames % args["frame_skip"] == 0:
-      predictions_rect = extract_rectangles_from_predictions(
-          frame, dataset_name, detector_model, args["confidence"])
-      tracker_by_id = matcher.match(tracker_by_id, predictions_rect, frame)
+    if predictions_rect is not None:
+      num_detection_frames += 1
+      with timer.stage("match"):
+        tracker_by_id = matcher.match(tracker_by_id, predictions_rect, frame)
     else:
-      predictions_rect = []
-      for tracker in tracker_by_id.values():
-        tracker.update(frame)
-        predictions_rect.append(utils.get_rect_from_tracker(tracker))
-
-    tracker_by_id = {
-        id_: tracker for id_, tracker in tracker_by_id.items()
-        if _is_inside_focus_zone(focus_rect, tracker)
-    }
+      with timer.stage("track"):
+        predictions_rect = tracker_updater.update(tracker_by_id.values(),
+                                                  frame)
 
-    for touch_line_counter in touch_line_counters:
-      touch_line_counter.update(tracker_by_id)
+    with timer.stage("zone_filter"):
+      # Remove objects near the outliers of the focus
+      tracker_by_id = _filter_focus_zone(zone_index, tracker_by_id)
+    timer.record("active_trackers", len(tracker_by_id))
 
-    for abs_counter in abs_counter_rects:
-      abs_counter.update(predictions_rect)
+    with timer.stage("counters"):
+      tracked_boxes = utils.rects_to_array([
+          utils.get_rect_from_tracker(tracker)
+          for tracker in tracker_by_id.values()
+      ])
+      touch_line_group.update(tracker_by_id, tracked_boxes)
+      abs_counter_group.update(predictions_rect,
+                               utils.rects_to_array(predictions_rect))
+    if boundary_recorder is not None:
+      boundary_recorder.update(frame_index, list(tracker_by_id), tracked_boxes)
+    if frame_skip is not None:
+      with timer.stage("schedule"):
+        frame_skip.update(list(tracker_by_id), tracked_boxes)
+      timer.record("detection_interval", frame_skip.interval)
 
-    for r in predictions_rect:
-      utils.draw_rect(frame, r, OUT_COLOR)
+    is_written = (annotated_writer is not None and
+                  annotated_writer.should_write(frame_index))
+    if args["display"] or is_written:
+      with timer.stage("annotate"):
+        annotation = _create_annotation(
+            utils.rects_to_array(predictions_rect), tracker_by_id,
+            tracked_boxes, abs_counter_rects, touch_line_counters)
+        if is_written:
+          # The writer draws on its own copy of a displayed frame.
+          annotated_writer.submit(
+              frame.copy() if args["display"] else frame, annotation)
+        if args["display"]:
+          _draw_detections(frame, annotation, dataset_name)
 
+    fps.update()
+    num_frames += 1
     if args["display"]:
-      _draw_detections(frame, tracker_by_id, dataset_name, abs_counter_rects,
-                       touch_line_counters)
-
       cv2.imshow("frame", frame)
       key = cv2.waitKey(1) & 0xFF
       if key == ord("q"):
         break
 
-  _save_stats(abs_counter_rects, touch_line_counters, output_directory,
-              frames_per_second)
+  fps.stop()
+  if args["prefetch"] > 0:
+    frames.close()
+  if annotated_writer is not None:
+    annotated_writer.close()
+  tracker_updater.report()
+  if args["profile"] and output_directory is not None:
+    _save_profile(input_video_path, output_directory, timer, fps.elapsed(),
+                  num_frames, num_detection_frames)
+  if frame_skip is not None and output_directory is not None:
+    out_f_name = os.path.join(output_directory, _DETECTION_INTERVAL_FILE_NAME)
+    print(f"Detection frames {num_detection_frames} of {num_frames}, saving "
+          f"intervals to {out_f_name}")
+    np.save(out_f_name,
+            np.array(frame_skip.interval_series.to_list(), dtype=np.int32))
+  if profiler is not None:
+    profiler.disable()
+    if output_directory is not None:
+      out_f_name = os.path.join(output_directory, _CPROFILE_FILE_NAME)
+      print(f"Saving to {out_f_name}")
+      profiler.dump_stats(out_f_name)
+  stream_state.tracker_by_id = tracker_by_id
+  stream_state.counted_ids_by_name = {
+      counter.name: counter.counted_ids & set(tracker_by_id)
+      for counter in touch_line_counters
+  }
+  if owns_stream_state:
+    stream_state.close()
 
-  # close any open windows
-  cv2.destroyAllWindows()
+  if output_directory is not None:
+    _save_stats(abs_counter_rects, touch_line_counters, output_directory,
+                series_frames_per_second, stats_writer, series_start_time_sec)
+  if cache is not None:
+    cache.close()
+
+  if args["display"]:
+    # close any open windows, headless OpenCV builds have none.
+    cv2.destroyAllWindows()
   vs.release()
+  if segment is not None:
+    return segments.SegmentResult(
+        {
+            counter.name: counter.get_frame_series()
+            for counter in abs_counter_rects + touch_line_counters
+        }, boundary_recorder.start, boundary_recorder.end,
+        boundary_recorder.count_frames_by_name,
+        timer if args["profile"] else None, num_frames, num_detection_frames,
+        _cprofile_stats(profiler) if profiler is not None else None)
+
+
+def _init_worker(args, num_threads):
+  global _worker_args, _worker_detector_model
+  cv2.setNumThreads(num_threads)
+  _worker_args = args
+  # Built on first use so that fully cached videos never load the model.
+  _worker_detector_model = detector.LazyDetector(args["model"])
+
+
+def _process_video_in_worker(input_fname):
+  print(f"Processing {input_fname}")
+  process_video(input_fname, _worker_args, _worker_detector_model)
+  return input_fname
+
+
+def _create_worker_pool(args):
+  """Returns a pool of args["workers"] processes, one detector each."""
+  num_threads = max(1, (os.cpu_count() or 1) // args["workers"])
+  # Spawned workers read these when numpy and OpenCV are imported.
+  for env_var in _THREAD_ENV_VARS:
+    os.environ.setdefault(env_var, str(num_threads))
+  context = multiprocessing.get_context("spawn")
+  return context.Pool(
+      args["workers"], initializer=_init_worker, initargs=(args, num_threads))
+
+
+def process_videos_in_pool(input_fnames, args):
+  """Processes videos in args["workers"] processes, one detector each."""
+  with _create_worker_pool(args) as pool:
+    for input_fname in pool.imap_unordered(_process_video_in_worker,
+                                           input_fnames):
+      print(f"Done {input_fname}")
+
+
+def _process_segment_in_worker(task):
+  input_fname, segment = task
+  print(f"Processing {input_fname} frames {segment.start} to {segment.end}")
+  return process_video(input_fname, _worker_args, _worker_detector_model,
+                       segment=segment)
+
+
+def process_video_in_segments(input_video_path, args):
+  """Processes time segments of one video in parallel and stitches them.
+
+  Every segment is processed in one of args["workers"] processes, starting
+  segment_overlap_sec seconds early so that objects already in the scene are
+  tracked. Tracks are matched across segment boundaries, objects are counted
+  by the first segment that counts them only.
+  """
+  if args["count_only"] and args["count_series"] == "sampled":
+    raise ValueError("segments need one count per frame, use filled series")
+  output_directory = _check_if_output_exists(input_video_path, args)
+  if output_directory is None:
+    return
+  vs = cv2.VideoCapture(input_video_path)
+  frames_per_second = int(vs.get(cv2.CAP_PROP_FPS))
+  # The first video frame is skipped by process_video.
+  num_frames = int(vs.get(cv2.CAP_PROP_FRAME_COUNT)) - 1
+  vs.release()
+  video_segments = segments.split_frames(
+      num_frames, args["segments"], args["frame_skip"],
+      int(round(args["segment_overlap_sec"] * frames_per_second)))
+  start_time = time.perf_counter()
+  with _create_worker_pool(args) as pool:
+    results = pool.map(
+        _process_segment_in_worker,
+        [(input_video_path, segment) for segment in video_segments])
+  elapsed_sec = time.perf_counter() - start_time
+
+  abs_counter_rects, touch_line_counters = _create_dataset_counters(
+      args["dataset"])
+  if args["count_only"]:
+    touch_line_counters = []
+  for counter_list, cumulative in ((abs_counter_rects, False),
+                                   (touch_line_counters, True)):
+    for counter in counter_list:
+      counter.count_series = run_length.RunLengthSeries(
+          segments.stitch_results(video_segments, results, counter.name,
+                                  cumulative))
+  stats_writer = _create_stats_writer(abs_counter_rects, touch_line_counters,
+                                      output_directory, frames_per_second,
+                                      args)
+  _save_stats(abs_counter_rects, touch_line_counters, output_directory,
+              frames_per_second, stats_writer)
+  if args["profile"]:
+    # Stages of all the segments, frames include the warm-ups.
+    timer = profiling.StageTimer()
+    for result in results:
+      timer.merge(result.timer)
+    _save_profile(input_video_path, output_directory, timer, elapsed_sec,
+                  sum(result.num_frames for result in results),
+                  sum(result.num_detection_frames for result in results))
+  if args["cprofile"]:
+    _save_cprofile_stats(output_directory,
+                         [result.cprofile_stats for result in results])
+
+
+def _read_completed_chunks(manifest_path):
+  """Returns the chunk paths of complete manifest lines."""
+  with open(manifest_path) as f_manifest:
+    lines = f_manifest.read().split("\n")
+  # The last element is empty or a line still being written.
+  return [line for line in lines[:-1] if line]
+
+
+def follow_streams(args):
+  """Processes stream chunks as download_stream completes them.
+
+  Every manifest matched by args["input"] is a stream. Its chunks are
+  processed in order with one detector shared by all streams and a
+  StreamState per stream, so tracks continue across chunk boundaries.
+  """
+  # Built on first use so that fully cached chunks never load the model.
+  detector_model = detector.LazyDetector(args["model"])
+  state_by_manifest = {}
+  num_handled_by_manifest = dd(int)
+  last_chunk_time = time.time()
+  while True:
+    for manifest_path in sorted(glob.glob(args["input"])):
+      chunks = _read_completed_chunks(manifest_path)
+      for input_fname in chunks[num_handled_by_manifest[manifest_path]:]:
+        if manifest_path not in state_by_manifest:
+          state_by_manifest[manifest_path] = StreamState(args)
+        print(f"Processing {input_fname}")
+        process_video(input_fname, args, detector_model,
+                      state_by_manifest[manifest_path])
+        num_handled_by_manifest[manifest_path] += 1
+        last_chunk_time = time.time()
+    if (args["idle_timeout"] > 0 and
+        time.time() - last_chunk_time > args["idle_timeout"]):
+      break
+    time.sleep(args["poll_interval"])
+  for stream_state in state_by_manifest.values():
+    stream_state.close()
+
+
+def _process_stream(input_fname, stream_args, stream_detector):
+  try:
+    print(f"Processing {input_fname}")
+    process_video(input_fname, stream_args, stream_detector)
+  finally:
+    stream_detector.close()
+  return input_fname
+
+
+def process_streams(args):
+  """Processes the streams listed in args["input"] with one shared model.
+
+  Every stream runs process_video on its own thread with its own matcher,
+  trackers and counters. Their detection frames are batched together by a
+  stream_batching.BatchScheduler, taking frames from the streams in turn.
+  """
+  with open(args["input"]) as f_streams:
+    streams = json.load(f_streams)
+  # Built on first use so that fully cached streams never load the model.
+  scheduler = stream_batching.BatchScheduler(
+      detector.LazyDetector(args["model"]), args["batch_size"],
+      args["max_batch_wait_ms"] / 1000.0)
+  # All streams are registered before any starts detecting, so that the first
+  # batches wait for every stream.
+  stream_detectors = [
+      stream_batching.StreamDetector(scheduler) for _ in streams
+  ]
+  try:
+    with concurrent.futures.ThreadPoolExecutor(len(streams)) as executor:
+      futures = []
+      for stream, stream_detector in zip(streams, stream_detectors):
+        # Frames are batched across streams, one at a time per stream.
+        stream_args = dict(
+            args,
+            dataset=stream["dataset"],
+            output=stream.get("output"),
+            batch_size=1)
+        futures.append(
+            executor.submit(_process_stream, stream["input"], stream_args,
+                            stream_detector))
+      for future in concurrent.futures.as_completed(futures):
+        print(f"Done {future.result()}")
+  finally:
+    scheduler.close()
 
 
 def main():
   args = vars(ap.parse_args())
+  if args["workers"] is None:
+    args["workers"] = max(1, args["segments"])
+  if args["multi_stream"]:
+    process_streams(args)
+    return
+
+  if args["follow"]:
+    follow_streams(args)
+    return
+
+  if args["segments"] > 1:
+    for input_fname in sorted(glob.glob(args["input"])):
+      print(f"Processing {input_fname} in {args['segments']} segments")
+      process_video_in_segments(input_fname, args)
+    return
+
+  if args["workers"] > 1:
+    process_videos_in_pool(sorted(glob.glob(args["input"])), args)
+    return
+
   handled_files = set()
   need_attention = glob.glob(args["input"])
   for input_fname in sorted(need_attention):
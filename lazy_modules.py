@@ -0,0 +1,13 @@
+"""Modules that take long to import, imported on first use.
+
+dlib, shapely, scipy and imutils add seconds to the start of every process,
+including spawned workers, and some code paths never need them.
+"""
+import functools
+import importlib
+
+
+@functools.lru_cache(maxsize=None)
+def load(module_name):
+  """Returns the named module, importing it on the first call only."""
+  return importlib.import_module(module_name)
@@ -1,10 +1,15 @@
-from scipy.optimize import linear_sum_assignment
-from scipy.spatial.distance import cdist
+import lazy_modules
 import utils
 
+# Cost of the pairs rejected by the gates, above any sum of pixel distances.
+_GATED_COST = 1e9
+
 
 class Matcher(object):
-  """Matches detected objects to existing ids."""
+  """Matches detected objects to existing ids.
+
+  Ids are never reused, an id dropped from the tracked objects is retired.
+  """
 
   def __init__(self):
     self.available_id = 0
@@ -17,7 +22,8 @@ class Matcher(object):
 
     Args:
       tracked_objects: objects being tracked.
-      new_rectangles: rectangles representing detected objects.
+      new_rectangles: rectangles representing detected objects, a list or a
+        common_types.RectBatch.
       frame: the frame that that the objects were detected from.
 
     Returns:
@@ -34,6 +40,9 @@ class Matcher(object):
     if not new_rectangles:
       return {}
 
+    linear_sum_assignment = lazy_modules.load(
+        "scipy.optimize").linear_sum_assignment
+    cdist = lazy_modules.load("scipy.spatial.distance").cdist
     tracked_ids = list(tracked_objects.keys())
     unmatched_tracked_ids = set(tracked_ids)
 
@@ -42,7 +51,7 @@ class Matcher(object):
         for k in tracked_ids
     ]
 
-    new_objects_centers = [rect.centroid_coords() for rect in new_rectangles]
+    new_objects_centers = utils.rect_centroids(new_rectangles)
     unmatched_new_objects = set(range(len(new_rectangles)))
 
     cost_matrix = cdist(tracked_objects_centers, new_objects_centers)
@@ -63,3 +72,103 @@ class Matcher(object):
       self.available_id += 1
 
     return tracked_objects
+
+
+class IncrementalMatcher(Matcher):
+  """Matches detected objects to existing ids, keeping existing trackers.
+
+  Trackers are moved to the detection frame and a matched tracker is only
+  re-seeded when its box drifted away from the detection. Assignments are
+  gated by IoU and center distance, and unmatched tracks are kept alive for
+  max_missed_detections detection frames.
+  """
+
+  def __init__(self,
+               tracker_updater,
+               reseed_iou=0.5,
+               min_iou=0.0,
+               max_distance=None,
+               max_missed_detections=1):
+    super(IncrementalMatcher, self).__init__()
+    self.tracker_updater = tracker_updater
+    self.reseed_iou = reseed_iou
+    self.min_iou = min_iou
+    self.max_distance = max_distance
+    self.max_missed_detections = max_missed_detections
+    self.missed_detections = {}
+
+  def _gated_assignment(self, tracked_rects, new_rectangles):
+    """Returns (row, col, iou) of accepted tracked to detected assignments."""
+    if not len(tracked_rects) or not len(new_rectangles):
+      return []
+    linear_sum_assignment = lazy_modules.load(
+        "scipy.optimize").linear_sum_assignment
+    cdist = lazy_modules.load("scipy.spatial.distance").cdist
+    ious = utils.iou_matrix(
+        utils.rects_to_array(tracked_rects),
+        utils.rects_to_array(new_rectangles))
+    cost_matrix = cdist(utils.rect_centroids(tracked_rects),
+                        utils.rect_centroids(new_rectangles))
+    gated = ious < self.min_iou
+    if self.max_distance is not None:
+      gated |= cost_matrix > self.max_distance
+    # Gated pairs are only picked when nothing else is left, so that they
+    # never take a detection away from a valid pair.
+    cost_matrix[gated] = _GATED_COST
+    rows, cols = linear_sum_assignment(cost_matrix)
+    return [(row, col, ious[row, col])
+            for row, col in zip(rows, cols)
+            if not gated[row, col]]
+
+  def match(self, tracked_objects, new_rectangles, frame):
+    """Matches tracked objects to detected objects.
+
+    Args:
+      tracked_objects: objects being tracked.
+      new_rectangles: rectangles representing detected objects, a list or a
+        common_types.RectBatch.
+      frame: the frame that that the objects were detected from.
+
+    Returns:
+      Mapping from a unique object id to an object represeting the
+        tracked object.
+    """
+    if new_rectangles is None:
+      new_rectangles = []
+    tracked_ids = list(tracked_objects.keys())
+    # Tracks may have been dropped since the last match, e.g. out of focus.
+    self.missed_detections = {
+        id_: missed for id_, missed in self.missed_detections.items()
+        if id_ in tracked_objects
+    }
+    tracked_rects = self.tracker_updater.update(tracked_objects.values(),
+                                                frame)
+    object_by_id = {}
+    unmatched_new_objects = set(range(len(new_rectangles)))
+    for row, col, iou in self._gated_assignment(tracked_rects,
+                                                new_rectangles):
+      existing_id = tracked_ids[row]
+      tracker = tracked_objects[existing_id]
+      if iou < self.reseed_iou:
+        # The tracker drifted, restart it from the detection.
+        tracker = self.create_new_tracker(frame, new_rectangles[col])
+      object_by_id[existing_id] = tracker
+      self.missed_detections.pop(existing_id, None)
+      unmatched_new_objects.remove(col)
+
+    for existing_id in tracked_ids:
+      if existing_id in object_by_id:
+        continue
+      missed = self.missed_detections.get(existing_id, 0) + 1
+      if missed > self.max_missed_detections:
+        self.missed_detections.pop(existing_id, None)
+        continue
+      self.missed_detections[existing_id] = missed
+      object_by_id[existing_id] = tracked_objects[existing_id]
+
+    for i in sorted(unmatched_new_objects):
+      object_by_id[self.available_id] = self.create_new_tracker(
+          frame, new_rectangles[i])
+      self.available_id += 1
+
+    return object_by_id
@@ -0,0 +1,194 @@
+"""Scene activity measures and the detection schedule derived from them."""
+import cv2
+import numpy as np
+import run_length
+
+# Frames are compared at 1 / _DOWNSCALE of their resolution.
+_DOWNSCALE = 4
+# Gray level change of a pixel to count it as moving.
+_PIXEL_DIFFERENCE_THRESHOLD = 25
+
+
+class FocusMotion(object):
+  """Fraction of the focus polygon pixels that changed since a reference frame.
+
+  Frames are compared over the bounding box of the polygon only, downscaled
+  and in gray levels. Without a polygon the whole frame is the focus.
+  """
+
+  def __init__(self, focus_polygon=None):
+    self.focus_polygon = None
+    if focus_polygon is not None:
+      self.focus_polygon = np.array(focus_polygon, dtype=np.int32).reshape(
+          -1, 2)
+    self.bounds = None
+    self.mask = None
+    self.reference = None
+    self.last_focus = None
+
+  def _init_mask(self, frame):
+    height, width = frame.shape[:2]
+    if self.focus_polygon is None:
+      self.bounds = (0, 0, width, height)
+    else:
+      start_x, start_y = np.clip(self.focus_polygon.min(axis=0), 0, None)
+      end_x, end_y = self.focus_polygon.max(axis=0) + 1
+      self.bounds = (int(start_x), int(start_y), int(min(end_x, width)),
+                     int(min(end_y, height)))
+    start_x, start_y, end_x, end_y = self.bounds
+    mask_shape = (max(1, (end_y - start_y) // _DOWNSCALE),
+                  max(1, (end_x - start_x) // _DOWNSCALE))
+    if self.focus_polygon is None:
+      self.mask = np.ones(mask_shape, dtype=bool)
+    else:
+      mask = np.zeros(mask_shape, dtype=np.uint8)
+      polygon = (self.focus_polygon - [start_x, start_y]) // _DOWNSCALE
+      cv2.fillPoly(mask, [polygon.astype(np.int32)], 1)
+      self.mask = mask.astype(bool)
+
+  def _focus_gray(self, frame):
+    if self.mask is None:
+      self._init_mask(frame)
+    start_x, start_y, end_x, end_y = self.bounds
+    focus = frame[start_y:end_y, start_x:end_x]
+    focus = cv2.resize(focus, self.mask.shape[::-1],
+                       interpolation=cv2.INTER_AREA)
+    if focus.ndim == 3:
+      focus = cv2.cvtColor(focus, cv2.COLOR_BGR2GRAY)
+    return focus
+
+  def score(self, frame, keep_reference=False):
+    """Returns the moving fraction of the focus, 0 without a reference.
+
+    Args:
+      frame: BGR or gray frame.
+      keep_reference: if set, the reference is not replaced by frame, see
+        update_reference.
+    """
+    gray = self._focus_gray(frame)
+    self.last_focus = gray
+    reference = self.reference
+    if not keep_reference or reference is None:
+      self.reference = gray
+    if reference is None:
+      return 0.0
+    moving = cv2.absdiff(gray, reference) > _PIXEL_DIFFERENCE_THRESHOLD
+    return np.count_nonzero(moving & self.mask) / float(
+        max(1, np.count_nonzero(self.mask)))
+
+  def update_reference(self):
+    """Makes the last scored frame the reference."""
+    self.reference = self.last_focus
+
+  def reset(self):
+    self.reference = None
+
+
+class MotionGate(object):
+  """Lets a detection through only if the focus moved since the last one.
+
+  Frames are compared to the frame of the last detection that went through,
+  so slow motion accumulates until it crosses motion_threshold.
+  """
+
+  def __init__(self, focus_motion, motion_threshold=0.001):
+    self.focus_motion = focus_motion
+    self.motion_threshold = motion_threshold
+
+  def should_detect(self, frame):
+    is_first = self.focus_motion.reference is None
+    score = self.focus_motion.score(frame, keep_reference=True)
+    if not is_first and score <= self.motion_threshold:
+      return False
+    self.focus_motion.update_reference()
+    return True
+
+
+class AdaptiveFrameSkip(object):
+  """Chooses detection frames from the scene activity.
+
+  After every detection the interval to the next one is updated:
+  - doubled, up to max_skip, when nothing is tracked and the focus is still,
+  - halved, down to min_skip, when at least busy_trackers objects are tracked
+    or the detection moved a tracked center by more than max_drift pixels,
+  - otherwise moved back towards base_skip.
+  While nothing is tracked, motion in the focus above motion_threshold starts
+  a detection right away, at least min_skip frames after the previous one.
+
+  Call is_detection for every frame, then update once the frame tracks are
+  known.
+  """
+
+  def __init__(self,
+               base_skip,
+               min_skip,
+               max_skip,
+               focus_motion,
+               motion_threshold=0.001,
+               busy_trackers=10,
+               max_drift=20.0):
+    self.base_skip = base_skip
+    self.min_skip = min_skip
+    self.max_skip = max_skip
+    self.focus_motion = focus_motion
+    self.motion_threshold = motion_threshold
+    self.busy_trackers = busy_trackers
+    self.max_drift = max_drift
+    self.interval = min(max(base_skip, min_skip), max_skip)
+    self.frames_since_detection = None
+    self.last_motion = 0.0
+    self.num_trackers = 0
+    self.centers_by_id = {}
+    self.interval_series = run_length.RunLengthSeries()
+
+  def is_detection(self, frame):
+    """Returns whether frame, the frame after the last update, is detected."""
+    is_first = self.frames_since_detection is None
+    is_detection = (is_first or
+                    self.frames_since_detection + 1 >= self.interval)
+    if self.num_trackers == 0:
+      # Motion is only tracked while idle, frames with objects move anyway.
+      self.last_motion = self.focus_motion.score(frame)
+      # Motion never detects more often than every min_skip frames.
+      is_detection = is_detection or (
+          self.last_motion > self.motion_threshold and
+          (is_first or self.frames_since_detection + 1 >= self.min_skip))
+    else:
+      self.focus_motion.reset()
+    self.frames_since_detection = (0 if is_detection else
+                                   self.frames_since_detection + 1)
+    self.interval_series.append(self.interval)
+    return is_detection
+
+  def update(self, tracked_ids, tracked_boxes):
+    """Updates the schedule with the tracks of the last frame.
+
+    Args:
+      tracked_ids: ids of the tracked objects.
+      tracked_boxes: (N, 4) array of their rectangles, in tracked_ids order.
+    """
+    centers = (tracked_boxes[:, 0:2] + tracked_boxes[:, 2:4]) / 2.0
+    centers_by_id = dict(zip(tracked_ids, centers))
+    if self.frames_since_detection == 0:
+      self._update_interval(self._drift(centers_by_id), len(centers_by_id))
+    self.centers_by_id = centers_by_id
+    self.num_trackers = len(centers_by_id)
+
+  def _drift(self, centers_by_id):
+    """Largest move of a tracked center by the detection of this frame."""
+    drift = 0.0
+    for id_, center in centers_by_id.items():
+      previous_center = self.centers_by_id.get(id_)
+      if previous_center is not None:
+        drift = max(drift, float(np.hypot(*(center - previous_center))))
+    return drift
+
+  def _update_interval(self, drift, num_trackers):
+    if num_trackers == 0 and self.last_motion <= self.motion_threshold:
+      self.interval = min(self.interval * 2, self.max_skip)
+    elif num_trackers >= self.busy_trackers or drift > self.max_drift:
+      self.interval = max(self.interval // 2, self.min_skip)
+    elif self.interval > self.base_skip:
+      self.interval = max(self.base_skip, self.min_skip)
+    else:
+      self.interval = min(self.interval * 2, self.base_skip)
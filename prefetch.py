@@ -0,0 +1,66 @@
+"""Runs an iterator ahead of its consumer on a background thread."""
+import queue
+import threading
+
+_END_OF_STREAM = object()
+_PUT_TIMEOUT_SEC = 0.1
+
+
+class _ProducerError(object):
+
+  def __init__(self, error):
+    self.error = error
+
+
+class PrefetchIterator(object):
+  """Iterates over items produced ahead of time by a background thread.
+
+  At most depth items are produced ahead of the consumer. Producer errors are
+  raised in the consumer. close() stops the producer, it is safe to call it
+  before the iterator is exhausted.
+  """
+
+  def __init__(self, iterable, depth):
+    self.items = queue.Queue(maxsize=depth)
+    self.stop_event = threading.Event()
+    self.thread = threading.Thread(
+        target=self._produce, args=(iterable,), daemon=True)
+    self.thread.start()
+
+  def _put(self, item):
+    while not self.stop_event.is_set():
+      try:
+        self.items.put(item, timeout=_PUT_TIMEOUT_SEC)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def _produce(self, iterable):
+    try:
+      for item in iterable:
+        if not self._put(item):
+          return
+    except Exception as e:  # pylint: disable=broad-except
+      self._put(_ProducerError(e))
+      return
+    self._put(_END_OF_STREAM)
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    if self.stop_event.is_set():
+      raise StopIteration
+    item = self.items.get()
+    if item is _END_OF_STREAM:
+      self.stop_event.set()
+      raise StopIteration
+    if isinstance(item, _ProducerError):
+      self.stop_event.set()
+      raise item.error
+    return item
+
+  def close(self):
+    self.stop_event.set()
+    self.thread.join()
@@ -0,0 +1,78 @@
+"""Lightweight wall time accounting of pipeline stages."""
+import collections
+import contextlib
+import time
+
+import numpy as np
+
+_PERCENTILES = (50, 90, 99)
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class StageTimer(object):
+  """Records the wall time of every execution of named stages."""
+
+  def __init__(self):
+    self.samples = collections.defaultdict(list)
+    self.values = collections.defaultdict(list)
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    start_time = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.samples[name].append(time.perf_counter() - start_time)
+
+  def add(self, name, seconds):
+    self.samples[name].append(seconds)
+
+  def record(self, name, value):
+    """Records a per frame value such as the number of active trackers."""
+    self.values[name].append(value)
+
+  def merge(self, other):
+    """Adds the samples and values of another StageTimer."""
+    for name, samples in other.samples.items():
+      self.samples[name].extend(samples)
+    for name, values in other.values.items():
+      self.values[name].extend(values)
+
+  def values_summary(self):
+    return {
+        name: {
+            "mean": float(np.mean(values)),
+            "max": float(np.max(values))
+        } for name, values in self.values.items()
+    }
+
+  def summary(self):
+    """Returns count, total and percentile times of every stage."""
+    summary = {}
+    for name, samples in self.samples.items():
+      samples_ms = 1000 * np.array(samples)
+      stage_summary = {
+          "count": len(samples),
+          "total_sec": float(samples_ms.sum() / 1000),
+          "mean_ms": float(samples_ms.mean()),
+          "max_ms": float(samples_ms.max()),
+      }
+      for percentile in _PERCENTILES:
+        stage_summary["p%d_ms" % percentile] = float(
+            np.percentile(samples_ms, percentile))
+      summary[name] = stage_summary
+    return summary
+
+
+class NullStageTimer(object):
+  """StageTimer stand-in that records nothing, for disabled profiling."""
+
+  def stage(self, name):
+    del name
+    return _NULL_CONTEXT
+
+  def add(self, name, seconds):
+    pass
+
+  def record(self, name, value):
+    pass
@@ -0,0 +1,59 @@
+"""Integer series stored as runs of repeated values."""
+import array
+import bisect
+
+import numpy as np
+
+
+class RunLengthSeries(object):
+  """Append only integer series that grows with its number of value changes.
+
+  values[r] is the value of the frames [ends[r - 1], ends[r]) of run r, the
+  first run starting at first_frame. Both are typed arrays. discard_before
+  drops the runs of frames that are not needed anymore, the last run is
+  always kept.
+  """
+
+  def __init__(self, values=()):
+    self.values = array.array("q")
+    self.ends = array.array("q")
+    self.first_frame = 0
+    for value in values:
+      self.append(value)
+
+  def __len__(self):
+    return self.ends[-1] if self.ends else 0
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += len(self)
+    if not self.first_frame <= index < len(self):
+      raise IndexError("frame %d is not in the series" % index)
+    return self.values[bisect.bisect_right(self.ends, index)]
+
+  def append(self, value):
+    if self.values and self.values[-1] == value:
+      self.ends[-1] += 1
+    else:
+      self.values.append(value)
+      self.ends.append(len(self) + 1)
+
+  def to_list(self, start=0):
+    """Returns the values of the frames from start on, one per frame."""
+    if start < self.first_frame:
+      raise IndexError("frames before %d were discarded" % self.first_frame)
+    run = bisect.bisect_right(self.ends, start)
+    if run == len(self.ends):
+      return []
+    ends = np.frombuffer(self.ends, dtype=np.int64)[run:]
+    lengths = np.diff(ends, prepend=start)
+    return np.repeat(np.frombuffer(self.values, dtype=np.int64)[run:],
+                     lengths).tolist()
+
+  def discard_before(self, index):
+    """Forgets the runs that end before index, except the last one."""
+    run = min(bisect.bisect_right(self.ends, index), len(self.ends) - 1)
+    if run > 0:
+      self.first_frame = self.ends[run - 1]
+      del self.values[:run]
+      del self.ends[:run]
@@ -0,0 +1,216 @@
+"""Time segments of a video processed apart and stitched back together."""
+import collections
+import math
+
+from common_types import RectBatch
+import lazy_modules
+
+# Frames [warmup_start, start) only warm up the trackers, counts are kept for
+# frames [start, end). end is None for the last segment, which runs until the
+# end of the video.
+Segment = collections.namedtuple("Segment", ["warmup_start", "start", "end"])
+
+# Tracks of a segment at a boundary with another segment: the box of every
+# tracked id and, by unique counter name, the tracked ids already counted.
+Boundary = collections.namedtuple("Boundary",
+                                  ["box_by_id", "counted_ids_by_name"])
+
+# Output of a segment. start and end are the Boundary after the frames
+# start - 1 and end - 1, None if the segment has no such frame. For the ids
+# tracked at start but not counted yet, count_frames_by_name holds the frame
+# where each unique counter counted them. timer is the profiling.StageTimer
+# and cprofile_stats the cProfile stats of the segment, None if not profiled.
+SegmentResult = collections.namedtuple(
+    "SegmentResult", [
+        "series_by_name", "start", "end", "count_frames_by_name", "timer",
+        "num_frames", "num_detection_frames", "cprofile_stats"
+    ],
+    defaults=(None, 0, 0, None))
+
+# Tracks of two segments at the same boundary are the same object above this
+# intersection over union.
+_MIN_BOUNDARY_IOU = 0.5
+
+
+def split_frames(num_frames, num_segments, frame_skip, warmup_frames):
+  """Splits frames [0, num_frames) into consecutive segments.
+
+  Segment starts are multiples of frame_skip so that every segment predicts on
+  the same frames as a single pass over the video.
+
+  Args:
+    num_frames: number of frames of the video, may be an estimate.
+    num_segments: maximum number of segments.
+    frame_skip: number of frames between predictions.
+    warmup_frames: minimum number of frames processed before each segment.
+
+  Returns:
+    A list of Segment.
+  """
+  length = int(math.ceil(num_frames / float(num_segments) / frame_skip))
+  length = max(1, length) * frame_skip
+  warmup = int(math.ceil(warmup_frames / float(frame_skip))) * frame_skip
+  segments = [
+      Segment(max(0, start - warmup), start, start + length)
+      for start in range(0, max(num_frames, 1), length)
+  ]
+  segments[-1] = segments[-1]._replace(end=None)
+  return segments
+
+
+class BoundaryRecorder(object):
+  """Records the tracks of a segment at its boundaries for stitching.
+
+  Call update with the tracks of every frame, once the unique counters were
+  updated with them.
+  """
+
+  def __init__(self, segment, counters):
+    self.segment = segment
+    self.counters = counters
+    self.start = None
+    self.end = None
+    # Ids tracked at start that are not counted yet, by counter name.
+    self.pending_ids_by_name = {}
+    self.count_frames_by_name = {counter.name: {} for counter in counters}
+
+  def _boundary(self, tracked_ids, tracked_boxes):
+    return Boundary(
+        dict(zip(tracked_ids, tracked_boxes.tolist())),
+        {counter.name: set(counter.counted_ids) for counter in self.counters})
+
+  def update(self, frame_index, tracked_ids, tracked_boxes):
+    """Records the tracks of a frame.
+
+    Args:
+      frame_index: index of the frame.
+      tracked_ids: ids of the tracked objects.
+      tracked_boxes: (N, 4) array of their rectangles, in tracked_ids order.
+    """
+    if frame_index == self.segment.start - 1:
+      self.start = self._boundary(tracked_ids, tracked_boxes)
+      self.pending_ids_by_name = {
+          name: set(tracked_ids) - counted_ids
+          for name, counted_ids in self.start.counted_ids_by_name.items()
+      }
+    elif frame_index >= self.segment.start:
+      for counter in self.counters:
+        pending_ids = self.pending_ids_by_name.get(counter.name)
+        if not pending_ids:
+          continue
+        counted_ids = pending_ids & counter.counted_ids
+        for id_ in counted_ids:
+          self.count_frames_by_name[counter.name][id_] = frame_index
+        pending_ids -= counted_ids
+    if self.segment.end is not None and frame_index == self.segment.end - 1:
+      self.end = self._boundary(tracked_ids, tracked_boxes)
+
+
+def match_tracks(previous_box_by_id, box_by_id, min_iou=_MIN_BOUNDARY_IOU):
+  """Matches the tracks of two segments at the same boundary.
+
+  Returns:
+    Mapping from an id of box_by_id to the id of previous_box_by_id tracking
+    the same object.
+  """
+  if not previous_box_by_id or not box_by_id:
+    return {}
+  previous_ids = list(previous_box_by_id)
+  ids = list(box_by_id)
+  iou = RectBatch(list(previous_box_by_id.values())).iou_matrix(
+      RectBatch(list(box_by_id.values())))
+  rows, cols = lazy_modules.load("scipy.optimize").linear_sum_assignment(-iou)
+  return {
+      ids[col]: previous_ids[row]
+      for row, col in zip(rows, cols)
+      if iou[row, col] >= min_iou
+  }
+
+
+def count_corrections(segment, previous_end, result, name,
+                      min_iou=_MIN_BOUNDARY_IOU):
+  """Returns the (frame, count change) of a unique counter of a segment.
+
+  Objects tracked across the segment start are counted as the previous
+  segment counted them: not again if it counted them, at the segment start
+  if only the warm-up of this segment counted them.
+
+  Args:
+    segment: the segment.
+    previous_end: end Boundary of the previous segment.
+    result: SegmentResult of the segment.
+    name: name of the unique counter.
+    min_iou: minimum intersection over union of the boxes of an object.
+  """
+  if previous_end is None or result.start is None:
+    return []
+  previous_counted_ids = previous_end.counted_ids_by_name[name]
+  counted_ids = result.start.counted_ids_by_name[name]
+  count_frames = result.count_frames_by_name[name]
+  corrections = []
+  for id_, previous_id in match_tracks(previous_end.box_by_id,
+                                       result.start.box_by_id,
+                                       min_iou).items():
+    is_previous_counted = previous_id in previous_counted_ids
+    if is_previous_counted and id_ in count_frames:
+      corrections.append((count_frames[id_], -1))
+    elif not is_previous_counted and id_ in counted_ids:
+      corrections.append((segment.start, 1))
+  return corrections
+
+
+def stitch_series(segments, series_list, cumulative, corrections_list=None):
+  """Concatenates the count series of segments into the series of the video.
+
+  Args:
+    segments: the segments, in order.
+    series_list: count series of every segment. Like a single pass series it
+      starts with the initial count followed by one count per frame, from the
+      segment warmup_start.
+    cumulative: whether counts accumulate over time, as the counts of unique
+      counters. Each segment then continues from the total of the previous
+      ones, without the objects counted during its warm-up as they were
+      counted by the previous segment.
+    corrections_list: optional (frame, count change) list of every segment,
+      see count_corrections, applied to cumulative counts.
+
+  Returns:
+    The stitched series, starting with a zero initial count.
+  """
+  if corrections_list is None:
+    corrections_list = [[]] * len(segments)
+  stitched = [0]
+  offset = 0
+  for segment, series, corrections in zip(segments, series_list,
+                                          corrections_list):
+    begin = segment.start - segment.warmup_start
+    values = list(series[begin + 1:])
+    if segment.end is not None:
+      values = values[:segment.end - segment.start]
+    if cumulative:
+      baseline = series[begin]
+      values = [value - baseline + offset for value in values]
+      for frame, change in corrections:
+        for i in range(frame - segment.start, len(values)):
+          values[i] += change
+      if values:
+        offset = values[-1]
+    stitched.extend(values)
+  return stitched
+
+
+def stitch_results(segments, results, name, cumulative):
+  """Stitches the series of counter name from the SegmentResult of segments.
+
+  Unique counters, which are cumulative, are corrected for the objects
+  tracked across segment boundaries, see count_corrections.
+  """
+  corrections_list = None
+  if cumulative:
+    corrections_list = [[]] + [
+        count_corrections(segment, previous.end, result, name)
+        for segment, previous, result in zip(segments[1:], results, results[1:])
+    ]
+  return stitch_series(segments,
+                       [result.series_by_name[name] for result in results],
+                       cumulative, corrections_list)
@@ -0,0 +1,137 @@
+"""Columnar counter stats files.
+
+A stats file holds one row per frame: the frame time followed by the value of
+every counter. It starts with a small JSON header describing the columns and
+is then only appended to, so it can be flushed while a video is processed and
+memory-mapped as a numpy structured array when read.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+STATS_FILE_NAME = "counts.stats"
+
+_MAGIC = b"XSTATS1\n"
+_HEADER_ALIGNMENT = 64
+_TIME_COLUMN = "time"
+_COUNT_DTYPE = "<i4"
+
+
+def _stats_dtype(counter_names):
+  return np.dtype([(_TIME_COLUMN, "<f8")] +
+                  [(name, _COUNT_DTYPE) for name in counter_names])
+
+
+def _encode_header(counter_names, frames_per_second):
+  header = json.dumps({
+      "counters": list(counter_names),
+      "frames_per_second": frames_per_second
+  }).encode("utf-8")
+  size = len(_MAGIC) + 4 + len(header)
+  padding = -size % _HEADER_ALIGNMENT
+  return _MAGIC + struct.pack("<I", len(header) + padding) + header + (
+      b" " * padding)
+
+
+def read_header(path):
+  """Returns (counter names, frames per second, data offset) of a file."""
+  with open(path, "rb") as f_stats:
+    if f_stats.read(len(_MAGIC)) != _MAGIC:
+      raise ValueError("%s is not a stats file" % path)
+    (header_size,) = struct.unpack("<I", f_stats.read(4))
+    header = json.loads(f_stats.read(header_size).decode("utf-8"))
+  return (header["counters"], header["frames_per_second"],
+          len(_MAGIC) + 4 + header_size)
+
+
+class StatsWriter(object):
+  """Appends counter series to a stats file.
+
+  Rows are written incrementally, every call to write_counters only appends
+  the frames counted since the previous call. An existing file is replaced
+  unless resume is set, rows are then appended after its rows with times
+  continuing from them.
+  """
+
+  def __init__(self, path, counter_names, frames_per_second,
+               start_time_sec=0.0, resume=False):
+    self.path = path
+    self.counter_names = list(counter_names)
+    self.frames_per_second = frames_per_second
+    # Time of the first row, the initial counts.
+    self.start_time_sec = start_time_sec
+    self.dtype = _stats_dtype(self.counter_names)
+    # Rows appended by this writer, counters start with the first of them.
+    self.num_written = 0
+    if resume and os.path.exists(path):
+      names, _, data_offset = read_header(path)
+      if names != self.counter_names:
+        raise ValueError("%s has counters %s, expected %s" %
+                         (path, names, self.counter_names))
+      num_rows = (os.path.getsize(path) - data_offset) // self.dtype.itemsize
+      # Drop a torn last row.
+      os.truncate(path, data_offset + num_rows * self.dtype.itemsize)
+      self.num_rows = num_rows
+      self.f_stats = open(path, "ab")
+    else:
+      self.num_rows = 0
+      self.f_stats = open(path, "wb")
+      self.f_stats.write(_encode_header(self.counter_names, frames_per_second))
+
+  def append(self, columns):
+    """Appends rows given one equally long sequence per counter."""
+    num_new_rows = len(columns[0]) if columns else 0
+    rows = np.zeros(num_new_rows, dtype=self.dtype)
+    rows[_TIME_COLUMN] = self.start_time_sec + np.arange(
+        self.num_rows, self.num_rows + num_new_rows) / float(
+            self.frames_per_second)
+    for name, column in zip(self.counter_names, columns):
+      rows[name] = column
+    rows.tofile(self.f_stats)
+    self.f_stats.flush()
+    self.num_rows += num_new_rows
+    self.num_written += num_new_rows
+
+  def write_counters(self, counters):
+    """Appends the frames of counters not written yet.
+
+    The counters then forget the written frames, their series only keep the
+    frames since the last call.
+    """
+    self.append(
+        [counter.get_frame_series(self.num_written) for counter in counters])
+    for counter in counters:
+      counter.discard_frame_series(self.num_written)
+
+  def close(self):
+    self.f_stats.close()
+
+
+def load_stats(path):
+  """Memory maps a stats file as a structured array, one field per column."""
+  names, _, data_offset = read_header(path)
+  dtype = _stats_dtype(names)
+  num_rows = (os.path.getsize(path) - data_offset) // dtype.itemsize
+  if num_rows == 0:
+    return np.zeros(0, dtype=dtype)
+  return np.memmap(
+      path, dtype=dtype, mode="r", offset=data_offset, shape=(num_rows,))
+
+
+def load_stats_many(paths):
+  """Loads stats files with the same counters into a single array.
+
+  Returns:
+    The concatenated rows of all files and an offsets array, the rows of
+    paths[i] are rows[offsets[i]:offsets[i + 1]].
+  """
+  tables = [load_stats(path) for path in paths]
+  if not tables:
+    return np.zeros(0, dtype=_stats_dtype([])), np.zeros(1, dtype=np.int64)
+  for path, table in zip(paths, tables):
+    if table.dtype != tables[0].dtype:
+      raise ValueError("%s counters differ from %s" % (path, paths[0]))
+  offsets = np.concatenate([[0], np.cumsum([len(table) for table in tables])])
+  return np.concatenate(tables), offsets
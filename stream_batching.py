@@ -0,0 +1,190 @@
+"""Batches the detections of streams processed on their own threads."""
+import threading
+import time
+
+import detector
+
+
+class _Request(object):
+  """Frames of one detect_batch call of a stream."""
+
+  def __init__(self, stream_id, frames, min_confidence, labels):
+    self.stream_id = stream_id
+    self.frames = frames
+    self.min_confidence = min_confidence
+    self.labels = labels
+    # Frames can only go through the model together if this is equal.
+    self.key = (min_confidence,
+                None if labels is None else frozenset(labels))
+    self.predictions = [None] * len(frames)
+    self.num_scheduled = 0
+    self.num_done = 0
+    self.error = None
+    self.start_time = time.perf_counter()
+    self.done = threading.Event()
+
+
+class BatchScheduler(object):
+  """Runs the detections of many streams in shared batched forward passes.
+
+  Every stream registers, then blocks in detect_batch until its frames went
+  through the model. A batch runs once batch_size frames are waiting, once
+  every registered stream is waiting or max_wait_sec after the oldest
+  waiting request. Batches take one frame per stream in turn, continuing
+  after the stream served last by the previous batch, so a stream with many
+  frames cannot starve the others. The model runs on a background thread.
+  """
+
+  def __init__(self, detector_model, batch_size, max_wait_sec=0.02):
+    self.detector_model = detector_model
+    self.batch_size = max(1, batch_size)
+    self.max_wait_sec = max_wait_sec
+    self.condition = threading.Condition()
+    # Waiting request of every registered stream, None if it is not waiting.
+    self.request_by_stream = {}
+    self.next_stream_id = 0
+    self.last_stream_id = -1
+    self.closed = False
+    self.num_batches = 0
+    self.num_frames = 0
+    self.thread = threading.Thread(target=self._run, daemon=True)
+    self.thread.start()
+
+  def register(self):
+    """Returns the id of a new stream."""
+    with self.condition:
+      stream_id = self.next_stream_id
+      self.next_stream_id += 1
+      self.request_by_stream[stream_id] = None
+      return stream_id
+
+  def unregister(self, stream_id):
+    with self.condition:
+      del self.request_by_stream[stream_id]
+      # The remaining streams may all be waiting now.
+      self.condition.notify_all()
+
+  def detect_batch(self, stream_id, frames, min_confidence=None, labels=None):
+    """Returns the predictions of frames once the model ran on them."""
+    if not frames:
+      return []
+    request = _Request(stream_id, list(frames), min_confidence, labels)
+    with self.condition:
+      self.request_by_stream[stream_id] = request
+      self.condition.notify_all()
+    request.done.wait()
+    if request.error is not None:
+      raise request.error
+    return request.predictions
+
+  def _wait_time(self):
+    """Seconds until the next batch is due, 0 if it is, None if idle."""
+    waiting = [
+        request for request in self.request_by_stream.values()
+        if request is not None
+    ]
+    if not waiting:
+      return None
+    num_frames = sum(
+        len(request.frames) - request.num_scheduled for request in waiting)
+    if (num_frames >= self.batch_size or
+        len(waiting) == len(self.request_by_stream)):
+      return 0.0
+    oldest_time = min(request.start_time for request in waiting)
+    return max(0.0, oldest_time + self.max_wait_sec - time.perf_counter())
+
+  def _next_batch(self):
+    """Returns up to batch_size (request, frame index) in round robin."""
+    stream_ids = sorted(self.request_by_stream)
+    # Continue after the stream served last by the previous batch.
+    start = sum(1 for id_ in stream_ids if id_ <= self.last_stream_id)
+    stream_ids = stream_ids[start:] + stream_ids[:start]
+    batch = []
+    key = None
+    is_progress = True
+    while len(batch) < self.batch_size and is_progress:
+      is_progress = False
+      for stream_id in stream_ids:
+        request = self.request_by_stream[stream_id]
+        if request is None or (key is not None and request.key != key):
+          continue
+        key = request.key
+        self.last_stream_id = stream_id
+        batch.append((request, request.num_scheduled))
+        request.num_scheduled += 1
+        if request.num_scheduled == len(request.frames):
+          self.request_by_stream[stream_id] = None
+        is_progress = True
+        if len(batch) == self.batch_size:
+          break
+    return batch
+
+  def _run(self):
+    while True:
+      with self.condition:
+        while True:
+          if self.closed:
+            return
+          wait_time = self._wait_time()
+          if wait_time == 0.0:
+            break
+          self.condition.wait(wait_time)
+        batch = self._next_batch()
+      first_request = batch[0][0]
+      try:
+        predictions = self.detector_model.detect_batch(
+            [request.frames[i] for request, i in batch],
+            first_request.min_confidence, first_request.labels)
+      except Exception as e:  # pylint: disable=broad-except
+        self._fail(batch, e)
+        continue
+      self.num_batches += 1
+      self.num_frames += len(batch)
+      for (request, i), frame_predictions in zip(batch, predictions):
+        request.predictions[i] = frame_predictions
+        request.num_done += 1
+        if request.num_done == len(request.frames):
+          request.done.set()
+
+  def _fail(self, batch, error):
+    """Raises error in the streams of batch, dropping their other frames."""
+    with self.condition:
+      for request, _ in batch:
+        if self.request_by_stream.get(request.stream_id) is request:
+          self.request_by_stream[request.stream_id] = None
+    for request, _ in batch:
+      request.error = error
+      request.done.set()
+
+  def close(self):
+    with self.condition:
+      self.closed = True
+      self.condition.notify_all()
+    self.thread.join()
+    if self.num_batches:
+      print(f"Detected {self.num_frames} frames in {self.num_batches} "
+            f"batches, {self.num_frames / self.num_batches:.2f} frames per "
+            "batch")
+
+
+class StreamDetector(detector.Detector):
+  """Detector of one stream, batched with the other streams of a scheduler."""
+
+  def __init__(self, scheduler):
+    super(StreamDetector, self).__init__()
+    self.scheduler = scheduler
+    self.stream_id = scheduler.register()
+
+  def detect(self, frame, min_confidence=None, labels=None):
+    return self.detect_batch([frame], min_confidence, labels)[0]
+
+  def detect_batch(self, frames, min_confidence=None, labels=None,
+                   timer=None):
+    # Forward passes are shared with other streams, not timed per stream.
+    del timer
+    return self.scheduler.detect_batch(self.stream_id, frames, min_confidence,
+                                       labels)
+
+  def close(self):
+    """Unregisters the stream, the other streams stop waiting for it."""
+    self.scheduler.unregister(self.stream_id)
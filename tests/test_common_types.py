@@ -0,0 +1,101 @@
+import unittest
+
+import numpy as np
+
+from common_types import Rectangle
+from common_types import RectBatch
+
+
+def _random_boxes(rng, num_boxes, size=100):
+  # Starts may be negative, Rectangle and RectBatch clip them at zero.
+  start = rng.randint(-10, size, (num_boxes, 2))
+  extent = rng.randint(0, size // 2, (num_boxes, 2))
+  return np.concatenate([start, start + extent], axis=1)
+
+
+def _to_rects(boxes):
+  return [Rectangle(*box) for box in boxes.tolist()]
+
+
+class RectBatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.rng = np.random.RandomState(0)
+
+  def test_conversions(self):
+    boxes = _random_boxes(self.rng, 50)
+    rects = _to_rects(boxes)
+    batch = RectBatch(boxes)
+    self.assertEqual(batch.boxes.tolist(),
+                     [list(rect.rectangle_coords()) for rect in rects])
+    self.assertEqual(RectBatch.from_rects(rects).boxes.tolist(),
+                     batch.boxes.tolist())
+    self.assertEqual([rect.rectangle_coords() for rect in batch],
+                     [rect.rectangle_coords() for rect in rects])
+    self.assertEqual(batch[3].rectangle_coords(), rects[3].rectangle_coords())
+    self.assertEqual(len(batch[[1, 2]]), 2)
+    self.assertEqual(len(RectBatch.empty()), 0)
+
+  def test_area_and_centroids(self):
+    boxes = _random_boxes(self.rng, 50)
+    rects = _to_rects(boxes)
+    batch = RectBatch(boxes)
+    self.assertEqual(batch.compute_area().tolist(),
+                     [rect.compute_area() for rect in rects])
+    self.assertEqual(batch.centroids().tolist(),
+                     [list(rect.centroid_coords()) for rect in rects])
+
+  def test_intersection_and_union(self):
+    boxes1 = _random_boxes(self.rng, 500)
+    boxes2 = _random_boxes(self.rng, 500)
+    intersection = RectBatch(boxes1).intersection(RectBatch(boxes2))
+    union = RectBatch(boxes1).union(RectBatch(boxes2))
+    for i, (rect1, rect2) in enumerate(zip(_to_rects(boxes1),
+                                           _to_rects(boxes2))):
+      expected = rect1.intersection(rect2)
+      self.assertEqual(intersection.compute_area()[i], expected.compute_area())
+      if expected.compute_area() > 0:
+        self.assertEqual(intersection[i].rectangle_coords(),
+                         expected.rectangle_coords())
+      else:
+        self.assertEqual(intersection[i].rectangle_coords(), (0, 0, 0, 0))
+      self.assertEqual(union[i].rectangle_coords(),
+                       rect1.union(rect2).rectangle_coords())
+
+  def test_empty_intersection(self):
+    batch = RectBatch([[0, 0, 10, 10]]).intersection(
+        RectBatch([[5, 20, 15, 30]]))
+    self.assertEqual(batch.boxes.tolist(), [[0, 0, 0, 0]])
+    self.assertEqual(
+        Rectangle(0, 0, 10, 10).intersection(Rectangle(5, 20, 15,
+                                                       30)).compute_area(), 0)
+
+  def test_clip(self):
+    boxes = _random_boxes(self.rng, 50)
+    bounds = Rectangle(10, 20, 60, 70)
+    for rect, clipped in zip(_to_rects(boxes), RectBatch(boxes).clip(bounds)):
+      self.assertEqual(clipped.rectangle_coords(), (
+          min(max(rect.start_x, 10), 60),
+          min(max(rect.start_y, 20), 70),
+          min(max(rect.end_x, 10), 60),
+          min(max(rect.end_y, 20), 70),
+      ))
+
+  def test_pairwise(self):
+    boxes1 = _random_boxes(self.rng, 30)
+    boxes2 = _random_boxes(self.rng, 20)
+    batch1 = RectBatch(boxes1)
+    batch2 = RectBatch(boxes2)
+    intersection_areas = batch1.intersection_areas(batch2)
+    iou = batch1.iou_matrix(batch2)
+    for i, rect1 in enumerate(_to_rects(boxes1)):
+      for j, rect2 in enumerate(_to_rects(boxes2)):
+        area = rect1.intersection(rect2).compute_area()
+        self.assertEqual(intersection_areas[i, j], area)
+        union_area = rect1.compute_area() + rect2.compute_area() - area
+        self.assertAlmostEqual(iou[i, j],
+                               area / union_area if union_area else 0.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import detection_cache
+import detector
+
+_LABELS = ["car", "bus", "truck"]
+_SETTINGS = dict(
+    video_hash="abc",
+    model_name="yolo3",
+    input_size=(416, 416),
+    frame_skip=12,
+    labels=set(_LABELS),
+    roi=None,
+    frame_width=1280,
+    image_rect=(0, 100, 650, 800))
+
+
+class CacheKeyTest(unittest.TestCase):
+
+  def test_same_settings_same_key(self):
+    self.assertEqual(
+        detection_cache.cache_key(**_SETTINGS),
+        detection_cache.cache_key(**dict(_SETTINGS, labels=_LABELS[::-1])))
+
+  def test_every_setting_invalidates(self):
+    key = detection_cache.cache_key(**_SETTINGS)
+    for name, value in [("video_hash", "abd"), ("model_name", "fake"),
+                        ("input_size", (608, 608)), ("frame_skip", 6),
+                        ("labels", {"car"}), ("roi", (0, 0, 100, 100)),
+                        ("frame_width", 640),
+                        ("image_rect", (0, 0, 650, 800)),
+                        ("image_rect", None)]:
+      with self.subTest(name=name, value=value):
+        self.assertNotEqual(
+            key, detection_cache.cache_key(**dict(_SETTINGS,
+                                                  **{name: value})))
+
+
+class DetectionCacheTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    predictions = detector.Predictions(
+        np.array([[1, 2, 30, 40], [5, 6, 70, 80]]),
+        np.array([0.5, 0.25], dtype=np.float32), np.array([2, 0]), _LABELS)
+    with tempfile.TemporaryDirectory() as cache_dir:
+      cache = detection_cache.DetectionCache(cache_dir, "key", _LABELS)
+      cache.append(12, predictions)
+      cache.append(24, predictions.select(np.zeros(2, dtype=bool)))
+      cache.close()
+      cache = detection_cache.DetectionCache(cache_dir, "key", _LABELS)
+      self.assertEqual(len(cache), 2)
+      self.assertIsNone(cache.get(0))
+      cached = cache.get(12)
+      np.testing.assert_array_equal(cached.boxes, predictions.boxes)
+      np.testing.assert_array_equal(cached.confidences,
+                                    predictions.confidences)
+      np.testing.assert_array_equal(cached.class_ids, predictions.class_ids)
+      self.assertEqual(len(cache.get(24)), 0)
+      cache.close()
+      self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+  def test_shared_cache(self):
+    predictions = detector.Predictions(
+        np.array([[1, 2, 30, 40]]), np.array([0.5], dtype=np.float32),
+        np.array([1]), _LABELS)
+    with tempfile.TemporaryDirectory() as cache_dir:
+      first = detection_cache.DetectionCache(cache_dir, "key", _LABELS)
+      first.append(0, predictions)
+      # Like another process, opened after the first one appended.
+      second = detection_cache.DetectionCache(cache_dir, "key", _LABELS)
+      for frame_index in range(1, 10):
+        cache = first if frame_index % 2 else second
+        cache.append(frame_index,
+                     predictions.translate(frame_index, frame_index))
+      first.close()
+      second.close()
+      cache = detection_cache.DetectionCache(cache_dir, "key", _LABELS)
+      self.assertEqual(len(cache), 10)
+      for frame_index in range(10):
+        np.testing.assert_array_equal(
+            cache.get(frame_index).boxes,
+            predictions.boxes + frame_index)
+      cache.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
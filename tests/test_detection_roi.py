@@ -0,0 +1,56 @@
+import unittest
+
+import cv2
+import numpy as np
+
+import detector
+import extract_stats_from_video
+import intersection_configuration
+
+_DATASET = "TEST_ROI_DATASET"
+
+
+class DetectionRoiTest(unittest.TestCase):
+
+  def setUp(self):
+    intersection_configuration.DS_TO_SPECIFIC_PARAMS[_DATASET] = {
+        intersection_configuration.DETECTION_BOUNDARIES: [(100, 10),
+                                                          (100, 90),
+                                                          (200, 90),
+                                                          (200, 10)],
+    }
+
+  def tearDown(self):
+    del intersection_configuration.DS_TO_SPECIFIC_PARAMS[_DATASET]
+    extract_stats_from_video._get_detection_roi.cache_clear()
+
+  def test_roi_bounds(self):
+    roi = extract_stats_from_video._get_detection_roi(_DATASET, 30)
+    # The start y, 10 - 30, is clamped to 0 by Rectangle.
+    self.assertEqual(roi.rectangle_coords(), (70, 0, 230, 120))
+
+  def test_translate(self):
+    predictions = detector.Predictions(
+        np.array([[1, 2, 30, 40]]), np.array([0.5]), np.array([0]), ["car"])
+    self.assertEqual(
+        predictions.translate(70, 5).boxes.tolist(), [[71, 7, 100, 45]])
+
+  def test_roi_boxes_in_frame_coordinates(self):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    cv2.rectangle(frame, (120, 40), (160, 70), (255, 255, 255), -1)
+    model = detector.FakeDetector()
+    roi = extract_stats_from_video._get_detection_roi(_DATASET, 30)
+    (roi_predictions,) = extract_stats_from_video._detect_frames(
+        model, [frame], 0.5, roi)
+    (predictions,) = extract_stats_from_video._detect_frames(
+        model, [frame], 0.5, None)
+    self.assertEqual(len(roi_predictions), 1)
+    # Boxes are decoded from coordinates relative to the model input size.
+    np.testing.assert_allclose(roi_predictions.boxes, predictions.boxes,
+                               atol=1)
+    np.testing.assert_allclose(roi_predictions.boxes, [[120, 40, 161, 71]],
+                               atol=1)
+
+
+if __name__ == "__main__":
+  unittest.main()
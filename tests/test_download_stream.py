@@ -0,0 +1,125 @@
+import functools
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import download_stream
+
+_CHUNKLIST = "chunklist_w123.m3u8"
+_PLAYLIST = ("#EXTM3U\n"
+             "#EXT-X-VERSION:3\n"
+             "#EXT-X-STREAM-INF:BANDWIDTH=1000000\n"
+             "%s\n" % _CHUNKLIST)
+
+
+class _PlaylistHandler(http.server.SimpleHTTPRequestHandler):
+
+  def log_message(self, *args):
+    pass
+
+
+class _LocalHlsServer(object):
+  """Serves a static HLS playlist from a temporary directory."""
+
+  def __init__(self):
+    self.directory = tempfile.mkdtemp()
+    with open(os.path.join(self.directory, "playlist.m3u8"), "w") as f:
+      f.write(_PLAYLIST)
+    self.server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(_PlaylistHandler, directory=self.directory))
+    self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+    self.thread = threading.Thread(target=self.server.serve_forever,
+                                   daemon=True)
+    self.thread.start()
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+    shutil.rmtree(self.directory)
+
+
+@unittest.skipIf(shutil.which("wget") is None, "wget is not installed")
+class StreamSchedulerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = _LocalHlsServer()
+    self.save_dir = tempfile.mkdtemp()
+    self.downloads = []
+
+  def tearDown(self):
+    self.server.close()
+    shutil.rmtree(self.save_dir)
+
+  def _fake_download(self, statuses, name, chuck_list, f_path, duration,
+                     stream):
+    """Writes an empty chunk, returns the next status of statuses."""
+    del duration, stream
+    self.downloads.append((name, chuck_list))
+    with open(f_path, "w"):
+      pass
+    return statuses.pop(0) if statuses else 0
+
+  def _run(self, statuses=(), steps=3, num_streams=1):
+    scheduler = download_stream.StreamScheduler(self.save_dir, steps, 1, 5)
+    for i in range(num_streams):
+      scheduler.add_stream("cam%d" % i, self.server.url)
+    get_chuck_list = mock.Mock(wraps=download_stream.get_chuck_list)
+    with mock.patch.object(download_stream, "download_chuck_list",
+                           functools.partial(self._fake_download,
+                                             list(statuses))), \
+         mock.patch.object(download_stream, "get_chuck_list", get_chuck_list):
+      scheduler.run()
+    return get_chuck_list
+
+  def _manifest_lines(self, name):
+    path = os.path.join(self.save_dir, name,
+                        download_stream.MANIFEST_FILE_NAME)
+    with open(path) as f_manifest:
+      return f_manifest.read().split()
+
+  def test_get_chuck_list(self):
+    self.assertEqual(
+        download_stream.get_chuck_list("cam", self.save_dir,
+                                       self.server.url), _CHUNKLIST)
+
+  def test_records_every_chunk_with_one_chunklist_fetch(self):
+    get_chuck_list = self._run(steps=3, num_streams=2)
+    self.assertEqual(get_chuck_list.call_count, 2)
+    self.assertEqual(len(self.downloads), 6)
+    self.assertTrue(
+        all(chuck_list == _CHUNKLIST for _, chuck_list in self.downloads))
+    self.assertEqual(len(self._manifest_lines("cam0")), 3)
+    self.assertEqual(len(self._manifest_lines("cam1")), 3)
+
+  def test_failed_download_refreshes_chunklist(self):
+    get_chuck_list = self._run(statuses=[1], steps=2)
+    self.assertEqual(get_chuck_list.call_count, 2)
+    # The failed chunk is not listed.
+    self.assertEqual(len(self._manifest_lines("cam0")), 1)
+
+  def test_callback_errors_are_raised(self):
+    errors = []
+
+    def run():
+      try:
+        self._run()
+      except OSError as e:
+        errors.append(e)
+
+    with mock.patch.object(download_stream, "_append_to_manifest",
+                           mock.Mock(side_effect=OSError("disk full"))):
+      # run() used to wait forever once a callback failed.
+      thread = threading.Thread(target=run, daemon=True)
+      thread.start()
+      thread.join(10)
+    self.assertFalse(thread.is_alive())
+    self.assertEqual([str(e) for e in errors], ["disk full"])
+
+
+if __name__ == "__main__":
+  unittest.main()
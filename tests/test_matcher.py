@@ -0,0 +1,39 @@
+import unittest
+
+from common_types import Rectangle
+from matcher import IncrementalMatcher
+
+
+def _box(center_x, center_y, size=10):
+  return Rectangle(center_x - size // 2, center_y - size // 2,
+                   center_x + size // 2, center_y + size // 2)
+
+
+class GatedAssignmentTest(unittest.TestCase):
+
+  def test_gated_pair_does_not_steal_detection(self):
+    matcher = IncrementalMatcher(None, max_distance=30)
+    tracked = [_box(100, 100), _box(160, 100)]
+    detected = [_box(125, 100), _box(100, 50)]
+    # Without gates in the solve, the two implausible pairs cost less than
+    # the valid pair plus the far one and nothing would be matched.
+    self.assertEqual(
+        [(row, col) for row, col, _ in matcher._gated_assignment(
+            tracked, detected)], [(0, 0)])
+
+  def test_iou_gate(self):
+    matcher = IncrementalMatcher(None, min_iou=0.3)
+    tracked = [_box(100, 100), _box(300, 300)]
+    detected = [_box(102, 100), _box(320, 300)]
+    self.assertEqual(
+        [(row, col) for row, col, _ in matcher._gated_assignment(
+            tracked, detected)], [(0, 0)])
+
+  def test_empty(self):
+    matcher = IncrementalMatcher(None, max_distance=30)
+    self.assertEqual(matcher._gated_assignment([], [_box(0, 0)]), [])
+    self.assertEqual(matcher._gated_assignment([_box(0, 0)], []), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
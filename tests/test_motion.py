@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+import motion
+
+
+def _noise_frames(num_frames, seed=0):
+  rng = np.random.RandomState(seed)
+  for _ in range(num_frames):
+    yield rng.randint(0, 256, (120, 160, 3), dtype=np.uint8)
+
+
+def _detection_frames(frame_skip, frames, tracked_boxes):
+  tracked_ids = list(range(len(tracked_boxes)))
+  detection_frames = []
+  for frame_index, frame in enumerate(frames):
+    if frame_skip.is_detection(frame):
+      detection_frames.append(frame_index)
+    frame_skip.update(tracked_ids, tracked_boxes)
+  return detection_frames
+
+
+class MotionGateTest(unittest.TestCase):
+
+  def test_still_focus_skips_detection(self):
+    gate = motion.MotionGate(motion.FocusMotion())
+    still = np.zeros((120, 160, 3), dtype=np.uint8)
+    self.assertTrue(gate.should_detect(still))
+    self.assertFalse(any(gate.should_detect(still) for _ in range(10)))
+
+  def test_motion_outside_focus_is_ignored(self):
+    # The focus is the lower left triangle of the frame left part, its
+    # bounding box also covers the upper right triangle.
+    gate = motion.MotionGate(
+        motion.FocusMotion([[0, 0], [0, 119], [119, 119]]))
+    grid_y, grid_x = np.mgrid[0:120, 0:160]
+    outside = (grid_x > grid_y + 16) | (grid_x >= 136)
+    still = np.zeros((120, 160, 3), dtype=np.uint8)
+    self.assertTrue(gate.should_detect(still))
+    for frame in _noise_frames(10):
+      self.assertFalse(gate.should_detect(np.where(outside[..., None], frame,
+                                                   still)))
+    inside = grid_x < grid_y - 16
+    self.assertTrue(
+        gate.should_detect(np.where(inside[..., None], frame, still)))
+
+
+class AdaptiveFrameSkipTest(unittest.TestCase):
+
+  def test_untracked_motion_respects_min_skip(self):
+    frame_skip = motion.AdaptiveFrameSkip(12, 3, 48, motion.FocusMotion())
+    detection_frames = _detection_frames(frame_skip, _noise_frames(240),
+                                         np.zeros((0, 4)))
+    self.assertEqual(detection_frames, list(range(0, 240, 3)))
+
+  def test_still_scene_backs_off_to_max_skip(self):
+    frame_skip = motion.AdaptiveFrameSkip(12, 3, 48, motion.FocusMotion())
+    still = np.zeros((120, 160, 3), dtype=np.uint8)
+    detection_frames = _detection_frames(frame_skip, [still] * 400,
+                                         np.zeros((0, 4)))
+    self.assertEqual(np.diff(detection_frames).max(), 48)
+    self.assertEqual(frame_skip.interval, 48)
+
+  def test_busy_scene_shortens_to_min_skip(self):
+    frame_skip = motion.AdaptiveFrameSkip(
+        12, 3, 48, motion.FocusMotion(), busy_trackers=2)
+    boxes = np.array([[0, 0, 10, 10], [20, 20, 30, 30]])
+    detection_frames = _detection_frames(frame_skip, _noise_frames(100),
+                                         boxes)
+    self.assertGreaterEqual(np.diff(detection_frames).min(), 3)
+    self.assertEqual(frame_skip.interval, 3)
+    self.assertEqual(
+        len(frame_skip.interval_series.to_list()), 100)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,45 @@
+import random
+import unittest
+
+import run_length
+
+
+class RunLengthSeriesTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    rng = random.Random(0)
+    for _ in range(100):
+      values = [rng.randint(-2, 2) for _ in range(rng.randint(0, 50))]
+      series = run_length.RunLengthSeries(values)
+      self.assertEqual(len(series), len(values))
+      self.assertEqual(series.to_list(), values)
+      self.assertEqual([series[i] for i in range(len(values))], values)
+      start = rng.randint(0, len(values))
+      self.assertEqual(series.to_list(start), values[start:])
+
+  def test_runs(self):
+    series = run_length.RunLengthSeries([3, 3, 3, 1, 1, 3])
+    self.assertEqual(list(series.values), [3, 1, 3])
+    self.assertEqual(list(series.ends), [3, 5, 6])
+    self.assertEqual(series[-1], 3)
+    with self.assertRaises(IndexError):
+      series[6]  # pylint: disable=pointless-statement
+
+  def test_discard_before(self):
+    values = [0, 0, 1, 1, 1, 2, 2, 3]
+    series = run_length.RunLengthSeries(values)
+    series.discard_before(6)
+    self.assertEqual(series.first_frame, 5)
+    self.assertEqual(series.to_list(5), values[5:])
+    self.assertEqual(series[6], 2)
+    with self.assertRaises(IndexError):
+      series.to_list(4)
+    series.append(3)
+    self.assertEqual(series.to_list(5), values[5:] + [3])
+    # The last run is always kept.
+    series.discard_before(100)
+    self.assertEqual(series.to_list(series.first_frame), [3, 3])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,125 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+import extract_stats_from_video
+import segments
+
+
+class SplitFramesTest(unittest.TestCase):
+
+  def test_segments_cover_frames(self):
+    video_segments = segments.split_frames(100, 3, 12, 10)
+    self.assertEqual([segment.start for segment in video_segments],
+                     [0, 36, 72])
+    self.assertEqual([segment.warmup_start for segment in video_segments],
+                     [0, 24, 60])
+    self.assertEqual([segment.end for segment in video_segments],
+                     [36, 72, None])
+
+  def test_stitch_series(self):
+    video_segments = [
+        segments.Segment(0, 0, 3),
+        segments.Segment(1, 3, None),
+    ]
+    # Series start with the initial count, then one count per frame from
+    # the segment warm-up start. The second segment counts one object during
+    # its warm-up frames 1 and 2.
+    series_list = [[0, 0, 1, 1, 2], [0, 1, 1, 2, 3]]
+    self.assertEqual(
+        segments.stitch_series(video_segments, series_list, False),
+        [0, 0, 1, 1, 2, 3])
+    self.assertEqual(
+        segments.stitch_series(video_segments, series_list, True),
+        [0, 0, 1, 1, 2, 3])
+    self.assertEqual(
+        segments.stitch_series(video_segments, [[0, 0, 1, 1, 2], [0, 1, 2, 2,
+                                                                  3]], True),
+        [0, 0, 1, 1, 1, 2])
+
+
+class BoundaryTest(unittest.TestCase):
+
+  def test_match_tracks(self):
+    previous_box_by_id = {1: [0, 0, 10, 10], 2: [100, 100, 120, 120]}
+    box_by_id = {7: [101, 100, 121, 120], 8: [0, 0, 10, 10], 9: [50, 50, 60,
+                                                                 60]}
+    self.assertEqual(segments.match_tracks(previous_box_by_id, box_by_id), {
+        7: 2,
+        8: 1
+    })
+    self.assertEqual(segments.match_tracks({}, box_by_id), {})
+
+  def test_count_corrections(self):
+    segment = segments.Segment(4, 10, None)
+    previous_end = segments.Boundary({
+        1: [0, 0, 10, 10],
+        2: [100, 100, 120, 120]
+    }, {"zone": {1}})
+    # Id 7 is object 1, counted again at frame 15. Id 8 is object 2, counted
+    # during the warm-up only.
+    result = segments.SegmentResult(
+        {}, segments.Boundary({
+            7: [0, 0, 10, 10],
+            8: [100, 100, 120, 120]
+        }, {"zone": {8}}), None, {"zone": {
+            7: 15
+        }})
+    self.assertEqual(
+        sorted(
+            segments.count_corrections(segment, previous_end, result,
+                                       "zone")), [(10, 1), (15, -1)])
+    video_segments = [segments.Segment(0, 0, 10), segment]
+    self.assertEqual(
+        segments.stitch_series(video_segments,
+                               [[0] * 11, [0] * 6 + [1] * 6 + [2] * 5], True,
+                               [[], [(10, 1), (15, -1)]]), [0] * 11 + [1] * 10)
+
+
+@unittest.skipIf(importlib.util.find_spec("dlib") is None,
+                 "dlib is not installed")
+class SegmentedVideoTest(unittest.TestCase):
+  """Segmented counts of a synthetic clip against a single pass."""
+
+  def setUp(self):
+    benchmark.register_benchmark_dataset()
+    self.work_dir = tempfile.mkdtemp()
+    self.video_path = os.path.join(self.work_dir, "clip.mp4")
+    benchmark.generate_synthetic_video(self.video_path, 30, 240)
+
+  def tearDown(self):
+    shutil.rmtree(self.work_dir)
+
+  def _args(self, output_directory):
+    os.makedirs(output_directory)
+    return vars(
+        extract_stats_from_video.ap.parse_args([
+            "-i", self.video_path, "-o", output_directory, "-ds",
+            benchmark.BENCHMARK_DATASET, "-m", "fake", "-f", "6"
+        ]))
+
+  def test_segmented_counts(self):
+    args = self._args(os.path.join(self.work_dir, "single"))
+    # A single pass is one segment without warm-up.
+    single = extract_stats_from_video.process_video(
+        self.video_path, args, segment=segments.Segment(0, 0, None))
+    num_frames = len(single.series_by_name["queue_left"]) - 1
+    video_segments = segments.split_frames(num_frames, 4, 6, 24)
+    results = [
+        extract_stats_from_video.process_video(
+            self.video_path, args, segment=segment)
+        for segment in video_segments
+    ]
+    for name, cumulative in (("queue_left", False), ("crossing_middle",
+                                                     True)):
+      self.assertEqual(
+          segments.stitch_results(video_segments, results, name, cumulative),
+          single.series_by_name[name])
+    self.assertGreater(single.series_by_name["crossing_middle"][-1], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import counters
+import stats_io
+
+_POLYGON = [[0, 0], [0, 100], [100, 100], [100, 0]]
+
+
+def _counter(counts):
+  counter = counters.AbsCounterTrackerPoly("zone", _POLYGON)
+  for count in counts:
+    counter.count_series.append(count)
+  return counter
+
+
+class StatsWriterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.work_dir = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.work_dir.name, stats_io.STATS_FILE_NAME)
+
+  def tearDown(self):
+    self.work_dir.cleanup()
+
+  def _write(self, counts, resume=False, flush_after=None):
+    writer = stats_io.StatsWriter(self.path, ["zone"], 10, resume=resume)
+    counter = _counter(counts[:flush_after])
+    if flush_after is not None:
+      writer.write_counters([counter])
+      for count in counts[flush_after:]:
+        counter.count_series.append(count)
+    writer.write_counters([counter])
+    writer.close()
+
+  def test_incremental_writes(self):
+    self._write([1, 2, 3, 4], flush_after=2)
+    stats = stats_io.load_stats(self.path)
+    self.assertEqual(stats["zone"].tolist(), [0, 1, 2, 3, 4])
+    np.testing.assert_allclose(stats["time"], np.arange(5) / 10.0)
+
+  def test_rerun_replaces_file(self):
+    self._write([1, 2, 3, 4, 5, 6])
+    self._write([7, 8], flush_after=1)
+    self.assertEqual(stats_io.load_stats(self.path)["zone"].tolist(),
+                     [0, 7, 8])
+
+  def test_resume_appends(self):
+    self._write([1, 2])
+    self._write([3, 4], resume=True, flush_after=1)
+    stats = stats_io.load_stats(self.path)
+    self.assertEqual(stats["zone"].tolist(), [0, 1, 2, 0, 3, 4])
+    np.testing.assert_allclose(stats["time"], np.arange(6) / 10.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
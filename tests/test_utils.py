@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+
+from common_types import Rectangle
+import utils
+
+
+def _random_boxes(rng, num_boxes, size=200):
+  start = rng.randint(0, size, (num_boxes, 2))
+  extent = rng.randint(1, size // 2, (num_boxes, 2))
+  return np.concatenate([start, start + extent], axis=1)
+
+
+def _to_rects(boxes):
+  return [Rectangle(*box) for box in boxes.tolist()]
+
+
+def _merged_indices(boxes, reference_boxes=None):
+  """Indices of the rectangles kept by merge_adjcent_predictions."""
+  rects = _to_rects(boxes)
+  reference_rects = (None if reference_boxes is None else
+                     _to_rects(reference_boxes))
+  merged = utils.merge_adjcent_predictions(rects, reference_rects)
+  # Rectangles are matched by identity, equal boxes may be repeated.
+  return [i for i, rect in enumerate(rects) if any(
+      rect is merged_rect for merged_rect in merged)]
+
+
+class SuppressOverlappingBoxesTest(unittest.TestCase):
+
+  def assert_same_as_merge(self, boxes, reference_boxes=None):
+    self.assertEqual(
+        utils.suppress_overlapping_boxes(boxes, reference_boxes).tolist(),
+        _merged_indices(boxes, reference_boxes))
+
+  def test_random_boxes(self):
+    rng = np.random.RandomState(0)
+    for _ in range(500):
+      self.assert_same_as_merge(_random_boxes(rng, rng.randint(0, 30)))
+
+  def test_random_boxes_with_reference(self):
+    rng = np.random.RandomState(1)
+    for _ in range(500):
+      self.assert_same_as_merge(
+          _random_boxes(rng, rng.randint(0, 30)),
+          _random_boxes(rng, rng.randint(0, 10)))
+
+  def test_ties(self):
+    rng = np.random.RandomState(2)
+    for _ in range(200):
+      boxes = _random_boxes(rng, rng.randint(1, 10))
+      # Duplicated boxes overlap exactly.
+      boxes = boxes[rng.randint(0, len(boxes), 2 * len(boxes))]
+      self.assert_same_as_merge(boxes)
+
+  def test_overlap_at_threshold_is_kept(self):
+    # Intersection 40 over a larger area of 100, exactly the 0.4 threshold.
+    boxes = np.array([[0, 0, 10, 10], [6, 0, 16, 10]])
+    self.assertEqual(utils.suppress_overlapping_boxes(boxes).tolist(), [0, 1])
+    self.assert_same_as_merge(boxes)
+
+  def test_empty(self):
+    empty = np.zeros((0, 4), dtype=np.int64)
+    self.assert_same_as_merge(empty)
+    self.assert_same_as_merge(empty, np.array([[0, 0, 10, 10]]))
+    self.assertEqual(
+        utils.suppress_overlapping_boxes(empty, scores=np.zeros(0)).tolist(),
+        [])
+
+  def test_scores_order(self):
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]])
+    self.assertEqual(utils.suppress_overlapping_boxes(boxes).tolist(),
+                     [0, 2])
+    self.assertEqual(
+        utils.suppress_overlapping_boxes(
+            boxes, scores=np.array([0.2, 0.9, 0.5])).tolist(), [1, 2])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+from shapely.geometry import box
+from shapely.geometry import Point
+from shapely.geometry import Polygon
+
+import intersection_configuration
+import zones
+
+_FOCUS = [(0, 100), (0, 290), (100, 520), (580, 415), (15, 100)]
+_POLYGONS_BY_NAME = {
+    "triangle": [(10, 10), (200, 40), (60, 300)],
+    "square": [(100, 100), (300, 100), (300, 300), (100, 300)],
+    "concave": [(0, 0), (150, 0), (150, 150), (75, 60), (0, 150)],
+}
+
+
+def _random_boxes(rng, num_boxes):
+  start = rng.randint(-20, 600, (num_boxes, 2))
+  return np.concatenate(
+      [start, start + rng.randint(0, 150, (num_boxes, 2))], axis=1)
+
+
+def _shapely_areas(polygons, boxes):
+  return np.array([[
+      box(*coords).intersection(Polygon(polygon)).area
+      for coords in boxes.tolist()
+  ] for polygon in polygons])
+
+
+class ZoneIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.zone_index = zones.ZoneIndex(_FOCUS, _POLYGONS_BY_NAME)
+    rng = np.random.RandomState(0)
+    # Random points and every polygon vertex, which lie on the boundaries.
+    vertices = [
+        vertex for polygon in list(_POLYGONS_BY_NAME.values()) + [_FOCUS]
+        for vertex in polygon
+    ]
+    self.points = np.concatenate(
+        [rng.randint(-50, 650, (3000, 2)),
+         np.array(vertices)])
+
+  def test_contains_matches_shapely(self):
+    contains = self.zone_index.contains(self.points)
+    for name, polygon in _POLYGONS_BY_NAME.items():
+      expected = [Polygon(polygon).contains(Point(x, y))
+                  for x, y in self.points.tolist()]
+      np.testing.assert_array_equal(
+          contains[self.zone_index.names.index(name)], expected)
+
+  def test_focus_matches_shapely(self):
+    focus = Polygon(_FOCUS)
+    np.testing.assert_array_equal(
+        self.zone_index.focus_contains(self.points),
+        [focus.contains(Point(x, y)) for x, y in self.points.tolist()])
+    np.testing.assert_allclose(
+        self.zone_index.focus_boundary_distance(self.points),
+        [focus.exterior.distance(Point(x, y))
+         for x, y in self.points.tolist()])
+
+  def test_from_dataset_params(self):
+    for params in intersection_configuration.DS_TO_SPECIFIC_PARAMS.values():
+      zone_index = zones.ZoneIndex.from_dataset_params(params)
+      self.assertEqual(
+          len(zone_index.names),
+          len(params[intersection_configuration.COUNT_IN_AREA]) +
+          len(params[intersection_configuration.COUNT_IN_AREA_UNIQUE]))
+
+
+class ZoneAreasTest(unittest.TestCase):
+
+  def setUp(self):
+    self.polygons = list(_POLYGONS_BY_NAME.values())
+    self.boxes = _random_boxes(np.random.RandomState(1), 500)
+    self.expected = _shapely_areas(self.polygons, self.boxes)
+
+  def test_exact_by_default(self):
+    zone_areas = zones.zone_areas(self.polygons)
+    self.assertIsInstance(zone_areas, zones.ZonePolygons)
+    np.testing.assert_allclose(
+        zone_areas.intersection_areas(self.boxes), self.expected)
+
+  def test_raster_tolerance(self):
+    zone_areas = zones.zone_areas(self.polygons, rasterize=True)
+    self.assertIsInstance(zone_areas, zones.ZoneRaster)
+    errors = np.abs(zone_areas.intersection_areas(self.boxes) - self.expected)
+    self.assertLess(errors.max(), 100.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
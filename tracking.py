@@ -0,0 +1,53 @@
+"""Updates correlation trackers on frames without detections."""
+import concurrent.futures
+import time
+
+import utils
+
+
+class TrackerUpdater(object):
+  """Updates all active trackers of a frame, concurrently when there are many.
+
+  dlib releases the GIL while updating a correlation tracker, so trackers of
+  the same frame are updated on a thread pool. Below min_parallel_trackers the
+  pool overhead is not worth it and trackers are updated serially.
+  """
+
+  def __init__(self, num_threads=1, min_parallel_trackers=4):
+    self.executor = None
+    if num_threads > 1:
+      self.executor = concurrent.futures.ThreadPoolExecutor(
+          max_workers=num_threads)
+    self.min_parallel_trackers = min_parallel_trackers
+    self.num_frames = 0
+    self.total_time_sec = 0.0
+    self.max_time_sec = 0.0
+
+  def update(self, trackers, frame):
+    """Updates trackers with frame and returns their new rectangles."""
+    start_time = time.time()
+    trackers = list(trackers)
+    if (self.executor is None or
+        len(trackers) < self.min_parallel_trackers):
+      for tracker in trackers:
+        tracker.update(frame)
+    else:
+      list(self.executor.map(lambda tracker: tracker.update(frame), trackers))
+    rects = [utils.get_rect_from_tracker(tracker) for tracker in trackers]
+    frame_time_sec = time.time() - start_time
+    self.num_frames += 1
+    self.total_time_sec += frame_time_sec
+    self.max_time_sec = max(self.max_time_sec, frame_time_sec)
+    return rects
+
+  def report(self):
+    if not self.num_frames:
+      return
+    mean_time_ms = 1000 * self.total_time_sec / self.num_frames
+    print(f"Tracking time per frame: mean {mean_time_ms:.2f}ms, "
+          f"max {1000 * self.max_time_sec:.2f}ms over {self.num_frames} "
+          "frames")
+
+  def close(self):
+    if self.executor is not None:
+      self.executor.shutdown(wait=True)
@@ -1,9 +1,8 @@
+import common_types
 from common_types import Rectangle
 import cv2
-import dlib
+import lazy_modules
 import numpy as np
-from shapely.geometry import Point
-from shapely.geometry import Polygon
 
 
 def get_rect_from_tracker(tracker):
@@ -13,6 +12,7 @@ def get_rect_from_tracker(tracker):
 
 
 def create_tracker(frame, rect):
+  dlib = lazy_modules.load("dlib")
   tracker = dlib.correlation_tracker()
   start_x, start_y, end_x, end_y = rect.rectangle_coords()
   rect = dlib.rectangle(start_x, start_y, end_x, end_y)
@@ -26,8 +26,9 @@ def crop_image(frame, rectangle):
 
 
 def is_fully_contained_poly(rect1, poly):
-  poly = Polygon(poly)
-  coords = Point(rect1.centroid_coords())
+  geometry = lazy_modules.load("shapely.geometry")
+  poly = geometry.Polygon(poly)
+  coords = geometry.Point(rect1.centroid_coords())
   return poly.contains(coords)
 
 
@@ -66,16 +67,95 @@ def merge_adjcent_predictions(predictions1, predictions2=None, overlap=0.4):
   return merged_predictions
 
 
+def rects_to_array(rects):
+  """Converts rectangles to an (N, 4) array of start and end coordinates."""
+  if isinstance(rects, common_types.RectBatch):
+    return rects.boxes
+  return np.array([rect.rectangle_coords() for rect in rects],
+                  dtype=np.int64).reshape(-1, 4)
+
+
+def _pairwise_areas(boxes1, boxes2):
+  """Returns pairwise intersection areas and the areas of both box sets."""
+  return (common_types.pairwise_intersection_areas(boxes1, boxes2),
+          common_types.box_areas(boxes1), common_types.box_areas(boxes2))
+
+
+def overlap_ratio_matrix(boxes1, boxes2):
+  """Pairwise intersection area divided by the larger area of the pair."""
+  intersection, areas1, areas2 = _pairwise_areas(boxes1, boxes2)
+  max_area = np.maximum(areas1[:, None], areas2[None, :])
+  return np.divide(intersection, max_area,
+                   out=np.zeros(max_area.shape), where=max_area > 0)
+
+
+def iou_matrix(boxes1, boxes2):
+  """Pairwise intersection over union."""
+  intersection, areas1, areas2 = _pairwise_areas(boxes1, boxes2)
+  union = areas1[:, None] + areas2[None, :] - intersection
+  return np.divide(intersection, union,
+                   out=np.zeros(union.shape), where=union > 0)
+
+
+def suppress_overlapping_boxes(boxes, reference_boxes=None, overlap=0.4,
+                               scores=None):
+  """Array version of merge_adjcent_predictions.
+
+  Args:
+    boxes: (N, 4) array of start_x, start_y, end_x, end_y.
+    reference_boxes: optional (M, 4) array, boxes overlapping any of them are
+      dropped. When empty, boxes are greedily merged among themselves.
+    overlap: boxes are dropped if their overlap ratio is above it.
+    scores: optional (N,) array, when set boxes are visited by decreasing
+      score instead of input order.
+
+  Returns:
+    Sorted indices of the kept boxes.
+  """
+  if reference_boxes is not None and len(reference_boxes):
+    ratios = overlap_ratio_matrix(boxes, reference_boxes)
+    return np.flatnonzero(~(ratios > overlap).any(axis=1))
+
+  overlapping = overlap_ratio_matrix(boxes, boxes) > overlap
+  order = np.arange(len(boxes))
+  if scores is not None:
+    order = np.argsort(-np.asarray(scores), kind="stable")
+  suppressed = np.zeros(len(boxes), dtype=bool)
+  keep = []
+  for i in order:
+    if suppressed[i]:
+      continue
+    keep.append(i)
+    suppressed |= overlapping[i]
+  return np.sort(np.array(keep, dtype=np.int64))
+
+
 def compute_predictions(model, frame, min_confidence, returned_labels):
-  conf_predictions = []
-  predictions = model.detect(frame)
-  for pred in predictions:
-    confidence = pred['confidence']
-    if confidence > min_confidence and pred['label'] in returned_labels:
-      conf_predictions.append(pred)
-  return conf_predictions
+  # Confidence and label filtering is done by the detector on whole arrays.
+  return model.detect(frame, min_confidence, returned_labels)
+
+
+def compute_predictions_batch(model, frames, min_confidence, returned_labels,
+                              timer=None):
+  return model.detect_batch(frames, min_confidence, returned_labels, timer)
 
 
 def pred_to_rect(pred):
   return Rectangle(pred['start_x'], pred['start_y'], pred['end_x'],
                    pred['end_y'])
+
+
+def predictions_to_rects(predictions):
+  return [Rectangle(*box) for box in predictions.boxes.tolist()]
+
+
+def predictions_to_rect_batch(predictions):
+  return common_types.RectBatch(predictions.boxes)
+
+
+def rect_centroids(rects):
+  """(N, 2) centroids of a RectBatch or a list of rectangles."""
+  if isinstance(rects, common_types.RectBatch):
+    return rects.centroids()
+  return np.array([rect.centroid_coords() for rect in rects],
+                  dtype=np.int64).reshape(-1, 2)
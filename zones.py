@@ -0,0 +1,238 @@
+"""Zones of the dataset configurations and their geometric queries.
+
+Intersection areas of rectangles with polygons are exact with ZonePolygons.
+ZoneRaster reads them from summed-area tables in constant time instead, they
+are then approximate along the polygon edges, typically off by a few tens of
+square pixels, which can change counts of objects near the count ratio.
+"""
+import cv2
+import intersection_configuration
+import lazy_modules
+import numpy as np
+
+# Each pixel is split into _SUPERSAMPLING x _SUPERSAMPLING cells when
+# rasterizing so that masks hold the fraction of the pixel inside the polygon.
+_SUPERSAMPLING = 4
+
+
+def _polygon_array(polygon):
+  return np.array(polygon, dtype=np.int32).reshape(-1, 2)
+
+
+def _coverage_mask(polygon, shape):
+  """Fraction of each pixel covered by the polygon."""
+  height, width = shape
+  mask = np.zeros((height * _SUPERSAMPLING, width * _SUPERSAMPLING), np.uint8)
+  cv2.fillPoly(mask, [polygon * _SUPERSAMPLING], 1)
+  mask = mask.reshape(height, _SUPERSAMPLING, width, _SUPERSAMPLING)
+  return mask.mean(axis=(1, 3))
+
+
+class ZoneRaster(object):
+  """Pixel masks of polygons together with their summed-area tables.
+
+  The intersection area between an axis aligned rectangle and each polygon is
+  read from four corners of the polygon integral image, independently of the
+  number of polygon vertices.
+  """
+
+  def __init__(self, polygons, shape=None):
+    polygons = [_polygon_array(polygon) for polygon in polygons]
+    if shape is None:
+      # Rectangles are clipped to the raster, nothing beyond the polygons can
+      # intersect them.
+      max_x, max_y = np.max([polygon.max(axis=0) for polygon in polygons],
+                            axis=0)
+      shape = (max_y + 1, max_x + 1)
+    self.shape = tuple(int(size) for size in shape)
+    self.integrals = np.zeros((len(polygons), self.shape[0] + 1,
+                               self.shape[1] + 1))
+    for integral, polygon in zip(self.integrals, polygons):
+      integral[1:, 1:] = _coverage_mask(polygon, self.shape).cumsum(
+          axis=0).cumsum(axis=1)
+
+  def intersection_areas(self, boxes):
+    """Returns a (num_polygons, N) array of intersection areas.
+
+    Args:
+      boxes: (N, 4) array of start_x, start_y, end_x, end_y.
+    """
+    height, width = self.shape
+    start_x = np.clip(boxes[:, 0], 0, width)
+    start_y = np.clip(boxes[:, 1], 0, height)
+    end_x = np.clip(boxes[:, 2], 0, width)
+    end_y = np.clip(boxes[:, 3], 0, height)
+    integrals = self.integrals
+    return (integrals[:, end_y, end_x] - integrals[:, start_y, end_x] -
+            integrals[:, end_y, start_x] + integrals[:, start_y, start_x])
+
+
+class ZonePolygons(object):
+  """Exact intersection areas of rectangles with polygons, like ZoneRaster.
+
+  Every rectangle is clipped by every polygon with shapely.
+  """
+
+  def __init__(self, polygons):
+    geometry = lazy_modules.load("shapely.geometry")
+    self.polygons = [
+        geometry.Polygon(_polygon_array(polygon)) for polygon in polygons
+    ]
+
+  def intersection_areas(self, boxes):
+    """Returns a (num_polygons, N) array of intersection areas.
+
+    Args:
+      boxes: (N, 4) array of start_x, start_y, end_x, end_y.
+    """
+    geometry = lazy_modules.load("shapely.geometry")
+    rects = [geometry.box(*coords) for coords in boxes.tolist()]
+    areas = np.zeros((len(self.polygons), len(rects)))
+    for i, polygon in enumerate(self.polygons):
+      for j, rect in enumerate(rects):
+        areas[i, j] = rect.intersection(polygon).area
+    return areas
+
+
+def zone_areas(polygons, rasterize=False):
+  """Returns a ZoneRaster if rasterize is set, else exact ZonePolygons."""
+  if rasterize:
+    return ZoneRaster(polygons)
+  return ZonePolygons(polygons)
+
+
+def _on_boundary(polygon, points_x, points_y):
+  """Exact test of integer points lying on the polygon edges."""
+  on_boundary = np.zeros(points_x.shape, dtype=bool)
+  for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+    cross = (x2 - x1) * (points_y - y1) - (y2 - y1) * (points_x - x1)
+    on_boundary |= ((cross == 0) & (points_x >= min(x1, x2)) &
+                    (points_x <= max(x1, x2)) & (points_y >= min(y1, y2)) &
+                    (points_y <= max(y1, y2)))
+  return on_boundary
+
+
+def _crosses_odd(polygon, points_x, points_y):
+  """Exact even-odd ray casting of integer points against the polygon."""
+  inside = np.zeros(points_x.shape, dtype=bool)
+  for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+    if y1 == y2:
+      continue
+    spans = (y1 <= points_y) != (y2 <= points_y)
+    # points_x < x1 + (points_y - y1) * (x2 - x1) / (y2 - y1) without division.
+    lhs = (points_x - x1) * (y2 - y1)
+    rhs = (points_y - y1) * (x2 - x1)
+    left = lhs < rhs if y2 > y1 else lhs > rhs
+    inside ^= spans & left
+  return inside
+
+
+def contains_points(polygon, points_x, points_y):
+  """Same as shapely Polygon.contains on integer points, boundary excluded."""
+  polygon = _polygon_array(polygon).astype(np.int64)
+  return (_crosses_odd(polygon, points_x, points_y) &
+          ~_on_boundary(polygon, points_x, points_y))
+
+
+def boundary_distance(polygon, points_x, points_y):
+  """Distance of points to the polygon exterior, computed like GEOS does."""
+  polygon = _polygon_array(polygon).astype(np.float64)
+  points_x = points_x.astype(np.float64)
+  points_y = points_y.astype(np.float64)
+  distance = np.full(points_x.shape, np.inf)
+  for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+    to_start = np.sqrt((points_x - x1)**2 + (points_y - y1)**2)
+    if x1 == x2 and y1 == y2:
+      distance = np.minimum(distance, to_start)
+      continue
+    to_end = np.sqrt((points_x - x2)**2 + (points_y - y2)**2)
+    length2 = (x2 - x1)**2 + (y2 - y1)**2
+    r = ((points_x - x1) * (x2 - x1) + (points_y - y1) * (y2 - y1)) / length2
+    s = ((y1 - points_y) * (x2 - x1) - (x1 - points_x) * (y2 - y1)) / length2
+    to_segment = np.abs(s) * np.sqrt(length2)
+    edge_distance = np.where(r <= 0, to_start,
+                             np.where(r >= 1, to_end, to_segment))
+    distance = np.minimum(distance, edge_distance)
+  return distance
+
+
+class ZoneIndex(object):
+  """Classifies integer points against all the zones of a dataset at once.
+
+  A label raster holds one bit per zone for every integer point of the zones
+  bounding box, along with the distance of every point to the focus polygon
+  boundary. Points outside of the raster are inside no zone and their
+  distance is computed directly. Results are the same as the shapely checks.
+  """
+
+  def __init__(self, focus_polygon, polygons_by_name):
+    self.names = list(polygons_by_name)
+    if len(self.names) > 64:
+      raise ValueError("At most 64 zones are supported, got %d" %
+                       len(self.names))
+    self.focus_polygon = focus_polygon
+    all_polygons = [_polygon_array(focus_polygon)] + [
+        _polygon_array(polygon) for polygon in polygons_by_name.values()
+    ]
+    max_x, max_y = np.max([polygon.max(axis=0) for polygon in all_polygons],
+                          axis=0)
+    self.shape = (int(max_y) + 1, int(max_x) + 1)
+    grid_y, grid_x = np.mgrid[0:self.shape[0], 0:self.shape[1]].astype(
+        np.int64)
+    self.labels = np.zeros(self.shape, dtype=np.uint64)
+    for bit, polygon in enumerate(polygons_by_name.values()):
+      self.labels[contains_points(polygon, grid_x, grid_y)] |= np.uint64(
+          1 << bit)
+    self.focus_labels = contains_points(focus_polygon, grid_x, grid_y)
+    self.focus_distance = boundary_distance(focus_polygon, grid_x, grid_y)
+
+  @classmethod
+  def from_dataset_params(cls, params):
+    """Builds the index of an intersection_configuration dataset entry."""
+    polygons_by_name = {}
+    for key in (intersection_configuration.COUNT_IN_AREA,
+                intersection_configuration.COUNT_IN_AREA_UNIQUE):
+      for name, polygon, _ in params[key]:
+        polygons_by_name[name] = polygon
+    return cls(params[intersection_configuration.DETECTION_BOUNDARIES],
+               polygons_by_name)
+
+  def _in_raster(self, points):
+    return ((points[:, 0] >= 0) & (points[:, 0] < self.shape[1]) &
+            (points[:, 1] >= 0) & (points[:, 1] < self.shape[0]))
+
+  def contains(self, points):
+    """Returns a (num_zones, N) bool array of points inside each zone.
+
+    Args:
+      points: (N, 2) integer array of x, y.
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    in_raster = self._in_raster(points)
+    labels = np.zeros(len(points), dtype=np.uint64)
+    labels[in_raster] = self.labels[points[in_raster, 1], points[in_raster, 0]]
+    bits = np.uint64(1) << np.arange(len(self.names), dtype=np.uint64)
+    return (labels[None, :] & bits[:, None]) != 0
+
+  def zone_contains(self, name, points):
+    return self.contains(points)[self.names.index(name)]
+
+  def focus_contains(self, points):
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    in_raster = self._in_raster(points)
+    inside = np.zeros(len(points), dtype=bool)
+    inside[in_raster] = self.focus_labels[points[in_raster, 1],
+                                          points[in_raster, 0]]
+    return inside
+
+  def focus_boundary_distance(self, points):
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    in_raster = self._in_raster(points)
+    distance = np.empty(len(points))
+    distance[in_raster] = self.focus_distance[points[in_raster, 1],
+                                              points[in_raster, 0]]
+    outside = ~in_raster
+    distance[outside] = boundary_distance(self.focus_polygon,
+                                          points[outside, 0],
+                                          points[outside, 1])
+    return distance